@@ -58,6 +58,11 @@ viable new point""",
                     default=1e7,
                     type=int)
 
+parser.add_argument("--block-size",
+                    help="""Number of candidate points drawn at a time""",
+                    default=4096,
+                    type=int)
+
 parser.add_argument("--old-bank",
                     help="""Old bank from which the new points should at least
 be a mchirp_window away""",
@@ -264,32 +269,24 @@ mchirp_min = (2. * mass_min) * (eta_max**0.6)
 mtotal_min = 2 * mass_min
 eta_min = mass_max * mass_min / (mass_max + mass_min)**2.
 q_min = 1.
-q_max = DA.get_q_from_eta(eta_min)
+q_max = (1. - 2. * eta_min + np.sqrt(1. - 4. * eta_min)) / (2. * eta_min)
 
 
 #{{{
 def sample_mass(N=1):
-    return SU.uniform_CompactObject_mass(N, mass_min, mass_max)
+    return SU.uniform_mass(N, mass_min, mass_max)
 
 
 def sample_mchirp(N=1):
-    return SU.uniform_CompactObject_mass(N, mchirp_min, mchirp_max)
+    return SU.uniform_bound(mchirp_min, mchirp_max, N)
 
 
 def sample_eta_uniform(N=1):
-    return SU.uniform_CompactObject_massratio(N, eta_min, eta_max)
+    return SU.uniform_bound(eta_min, eta_max, N)
 
 
 def sample_q_uniform(N=1):
-    return SU.uniform_CompactObject_massratio(N, q_min, q_max)
-
-
-def sample_smag(N=1):
-    return SU.uniform_spin_magnitude(N, smag_min, smag_max)
-
-
-def sample_sxyz(N=1):
-    return SU.uniform_bound(sxyz_min, sxyz_max, N)
+    return SU.uniform_massratio(N, q_min, q_max)
 
 
 def sample_ecc(N=1):
@@ -320,18 +317,6 @@ def sample_pol(N=1):
     return SU.uniform_bound(pol_min, pol_max, N)
 
 
-def sample_lat_lon(N=1):
-    if lat_min == lat_max or lon_min == lon_max:
-        return SU.uniform_bound(lat_min, lat_max, N),\
-               SU.uniform_bound(lon_min, lon_max, N)
-    lat, lon = SU.CubeToUniformOnS2(np.random.uniform(0, 1, N),
-                                    np.random.uniform(0, 1, N))
-    while lat > lat_max or lat < lat_min or lon > lon_max or lon < lon_min:
-        lat, lon = SU.CubeToUniformOnS2(np.random.uniform(0, 1, N),
-                                        np.random.uniform(0, 1, N))
-    return lat, lon
-
-
 def get_sim_hash(N=1, num_digits=10):
     return ilwd.ilwdchar(":%s:0" %
                          DA.get_unique_hex_tag(N=N, num_digits=num_digits))
@@ -360,65 +345,80 @@ def accept_point(mc, eta):
 
 
 ################### Functions to sample & reject ##################
-def get_new_sample_point():
-    """This function returns an instance of lsctables.SimInspiral, with elements
-  corresponding to various physical parameters uniformly sampled within their
-  respective ranges. """
-    p = lsctables.SimInspiral()
-
-    # Masses
-    p.mchirp = sample_mchirp()
-    p.eta = sample_eta_uniform()
-    while not accept_point(p.mchirp, p.eta):
-        p.mchirp = sample_mchirp()
-        p.eta = sample_eta_uniform()
+# Columns of the sample points drawn by get_new_sample_points, all of which
+# are copied into SimInspiral rows. 'sim_hash' holds the simulation_id.
+SAMPLE_POINT_COLUMNS = SU.SAMPLE_POINT_COLUMNS
+
+
+def get_new_sample_points(N):
+    """This function returns a numpy record array of N sample points, with
+    fields SAMPLE_POINT_COLUMNS + ['sim_hash'] corresponding to various physical
+    parameters uniformly sampled within their respective ranges. Records can be
+    tested as they are, and turned into lsctables.SimInspiral rows with
+    sample_point_to_row once accepted."""
+    p = np.recarray(N, dtype=SU.SAMPLE_POINT_DTYPE)
+
+    # Masses, drawn in blocks of N until N of them are accepted
+    mchirp, eta = np.zeros(0), np.zeros(0)
+    while len(mchirp) < N:
+        _mchirp, _eta = sample_mchirp(N), sample_eta_uniform(N)
+        m1, m2 = mchirp_eta_to_mass1_mass2(_mchirp, _eta)
+        keep = (m1 <= mass_max) & (m1 >= mass_min) &\
+               (m2 <= mass_max) & (m2 >= mass_min) &\
+               (m1 + m2 <= mtotal_max) & (m1 + m2 >= mtotal_min)
+        mchirp = np.append(mchirp, _mchirp[keep])
+        eta = np.append(eta, _eta[keep])
+    p.mchirp, p.eta = mchirp[:N], eta[:N]
     p.mass1, p.mass2 = mchirp_eta_to_mass1_mass2(p.mchirp, p.eta)
 
     # Spins
-    p.spin1x = sample_sxyz()
-    p.spin1y = sample_sxyz()
-    p.spin1z = sample_sxyz()
-    smag = np.sqrt(p.spin1x**2. + p.spin1y**2. + p.spin1z**2.)
-    if smag > smag_max or smag < smag_min:
-        newsmag = sample_smag()
-        p.spin1x *= (newsmag / smag)
-        p.spin1y *= (newsmag / smag)
-        p.spin1z *= (newsmag / smag)
-
-    p.spin2x = sample_sxyz()
-    p.spin2y = sample_sxyz()
-    p.spin2z = sample_sxyz()
-    smag = np.sqrt(p.spin2x**2. + p.spin2y**2. + p.spin2z**2.)
-    if smag > smag_max or smag < smag_min:
-        newsmag = sample_smag()
-        p.spin2x *= (newsmag / smag)
-        p.spin2y *= (newsmag / smag)
-        p.spin2z *= (newsmag / smag)
+    p.spin1x, p.spin1y, p.spin1z = SU.uniform_spin_vectors(
+        N, sxyz_min, sxyz_max, smag_min, smag_max)
+    p.spin2x, p.spin2y, p.spin2z = SU.uniform_spin_vectors(
+        N, sxyz_min, sxyz_max, smag_min, smag_max)
 
     # Orbital parameters
-    p.alpha = sample_ecc()
-    p.alpha1 = sample_mean_per_ano()
-    p.alpha2 = sample_long_asc_nodes()
-    p.coa_phase = sample_coa_phase()
+    p.alpha = sample_ecc(N)
+    p.alpha1 = sample_mean_per_ano(N)
+    p.alpha2 = sample_long_asc_nodes(N)
+    p.coa_phase = sample_coa_phase(N)
 
     # Orientation and location
-    p.inclination = sample_inc()
-    p.distance = sample_dist()
+    p.inclination = sample_inc(N)
+    p.distance = sample_dist(N)
 
     # Polarization
-    p.polarization = sample_pol()
+    p.polarization = sample_pol(N)
 
     # Sky angles
-    p.latitude, p.longitude = sample_lat_lon()
+    p.latitude, p.longitude = SU.uniform_on_S2_window(
+        N, (lat_min, lat_max), (lon_min, lon_max))
+
+    # Unique HASH, 10 hex digits
+    p.sim_hash = np.random.randint(0, 16**10, N, dtype=np.int64)
+    return p
 
-    # Unique HASH
-    p.simulation_id = get_sim_hash()
+
+def sample_point_to_row(point):
+    """Materialize one record of get_new_sample_points as an instance of
+    lsctables.SimInspiral"""
+    p = lsctables.SimInspiral()
+    for c in SAMPLE_POINT_COLUMNS:
+        setattr(p, c, float(point[c]))
+    p.simulation_id = ilwd.ilwdchar(":%010x:0" % point['sim_hash'])
 
     # Process ID
     p.process_id = out_proc_id
     return p
 
 
+def iter_new_sample_points(block_size):
+    """Endless stream of candidate sample points, drawn block_size at a time"""
+    while True:
+        for point in get_new_sample_points(block_size):
+            yield point
+
+
 def within_mchirp_window(bank, sim, w):
     #{{{
     if hasattr(bank, "mchirp"):
@@ -447,27 +447,26 @@ def within_ecc_window(bank, sim, w):
     return False
 
 
-def reject_new_sample_point(new_point,
-                            points_table,
-                            in_mchirp_window,
-                            ecc_window=0.0):
-    """This function takes in a new proposed point, and finds its mchirp distance
-  with all points in the points_table. If all of these distances are >
-  in_mchirp_window, it returns True, else returns False.
-  Which implies that if the new proposed point should be rejected from the set,
-  it returns True, and False if that point should be kept."""
-    if in_mchirp_window:
-        mchirp_window = in_mchirp_window
-    else:
-        mchirp_window = 0.0
+def point_mchirp(point):
+    """Chirp mass of a point, as within_mchirp_window computes it"""
+    if hasattr(point, "mchirp"):
+        return point.mchirp
+    elif hasattr(point, "mass1") and hasattr(point, "mass2"):
+        return mass1_mass2_to_mchirp_eta(point.mass1, point.mass2)[0]
+    elif hasattr(point, "mtotal") and hasattr(point, "eta"):
+        return point.mtotal * (point.eta**0.6)
 
-    for point in points_table:
-        if within_mchirp_window(new_point, point,
-                                mchirp_window) and within_ecc_window(
-                                    new_point, point, ecc_window):
-            return True
 
-    return False
+def reject_new_sample_point(new_point, points_index):
+    """This function takes in a new proposed point, and checks whether it lies
+  within the mchirp and eccentricity windows (see within_mchirp_window and
+  within_ecc_window) of any point in points_index, an instance of
+  gwnr.analysis.ChirpMassEccentricityIndex. Only points inside its chirp mass
+  window are visited.
+  If the new proposed point should be rejected from the set, it returns True,
+  and False if that point should be kept."""
+    return points_index.within_windows(point_mchirp(new_point),
+                                       new_point.alpha)
 
 
 #}}}
@@ -535,6 +534,12 @@ new_points_doc.childNodes[0].appendChild(new_points_table)
 #{{{
 num_new_points = np.int(options.num_new_points)
 
+candidates = iter_new_sample_points(options.block_size)
+# Index the old points once, and every accepted point as it is accepted
+points_index = DA.ChirpMassEccentricityIndex(options.mchirp_window,
+                                             options.ecc_window)
+points_index.extend([point_mchirp(p) for p in old_points_table],
+                    [p.alpha for p in old_points_table])
 break_now = False
 cnt = 0
 while cnt < num_new_points:
@@ -542,32 +547,26 @@ while cnt < num_new_points:
         if cnt % (num_new_points / 50) == 0:
             logging.info("%d points chosen" % cnt)
     if cnt == 0:
-        new_point = get_new_sample_point()
-        new_points_table.append(new_point)
+        new_point = next(candidates)
+        new_points_table.append(sample_point_to_row(new_point))
+        points_index.add(point_mchirp(new_point), new_point.alpha)
         cnt += 1
         continue
 
     k = 0
-    new_point = get_new_sample_point()
-    while reject_new_sample_point(new_point,\
-                                  new_points_table,\
-                                  options.mchirp_window,\
-                                  options.ecc_window) or\
-          (len(old_points_table) > 0 and\
-          reject_new_sample_point(new_point,\
-                                  old_points_table,\
-                                  options.mchirp_window,\
-                                  options.ecc_window)):
+    new_point = next(candidates)
+    while reject_new_sample_point(new_point, points_index):
         if options.verbose and k % (num_new_points / 50) == 0:
             logging.info("\t\t ...rejecting sample %d" % k)
             sys.stdout.flush()
         k += 1
-        new_point = get_new_sample_point()
+        new_point = next(candidates)
         if k > options.max_attempts:
             break_now = True
             break  # Max out at 1,000,000 attempts to find a point!
 
-    new_points_table.append(new_point)
+    new_points_table.append(sample_point_to_row(new_point))
+    points_index.add(point_mchirp(new_point), new_point.alpha)
     cnt += 1
     if break_now:
         logging.info("ONLY FILLED IN {} POINTS IN REASONABLE TIME.".format(
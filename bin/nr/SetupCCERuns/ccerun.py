@@ -30,6 +30,8 @@ import time
 import subprocess as cmd
 import glob
 import h5py
+import multiprocessing
+from gwnr.utils.memory import LRUCache
 import matplotlib as plt  # FIXM
 from matplotlib import use
 use('Agg')
@@ -93,6 +95,50 @@ def get_uniform_mass_range(m_lower, m_upper, m_sep):
     # }}}
 
 
+# Blending windows (in units of the total mass M) used by `blend`, and the
+# lower frequency cutoff used to deduce the lowest total mass
+BLEND_TIMES = [100, 1000, 2000, 50, 100]
+OVERLAP_F_LOWER = 15. - 0.5
+
+
+def lowest_totalmass_for_overlaps(wav1, wav2, mf_lower=-1., m_lower=-1.):
+    # Lowest total mass to compute overlaps at, from a) mf_lower, b) m_lower,
+    # or c) the orbital frequencies of both waveforms after blending
+    # {{{
+    if mf_lower > 0:
+        m_lower = mf_lower / OVERLAP_F_LOWER / lal.MTSUN_SI
+    elif m_lower <= 0:
+        t_blend = max(BLEND_TIMES[1:3])
+        rescaled_mass, orbit_freq1 = wav1.get_orbital_frequency(t=t_blend)
+        rescaled_mass, orbit_freq2 = wav2.get_orbital_frequency(t=t_blend)
+        m_lower = max(orbit_freq1,
+                      orbit_freq2) * rescaled_mass / OVERLAP_F_LOWER
+        print(orbit_freq1, orbit_freq2, "lowest total Mass = %f" % m_lower)
+    return m_lower
+    # }}}
+
+
+def overlaps_at_totalmass(wav1, wav2, mtot, psd=None):
+    # Rescale both waveforms to total mass mtot, blend them with every
+    # window, and return [mtot, overlap_window_1, overlap_window_2, ...]
+    # {{{
+    wav_blended1 = blend(wav1, mtot, wav1.sample_rate, wav1.time_length,
+                         BLEND_TIMES)  # blending
+    wav_blended2 = blend(wav2, mtot, wav1.sample_rate, wav1.time_length,
+                         BLEND_TIMES)  # blending
+    if len(wav_blended1) != len(wav_blended2):
+        raise RuntimeError(
+            "blending function return different sets of waveforms!!")
+    tmp_overlaps = [mtot]
+    for ii in range(len(wav_blended1)):
+        hp1, hp2 = wav_blended1[ii], wav_blended2[ii]
+        olap = overlap_between_waveforms(hp1, hp2, psd=psd)
+        tmp_overlaps.append(olap)
+        print("--In OvsM: window %d, overlap = %f" % (ii, olap))
+    return tmp_overlaps
+    # }}}
+
+
 def overlaps_vs_totalmass(wav1,
                           wav2,
                           psd=None,
@@ -104,47 +150,148 @@ def overlaps_vs_totalmass(wav1,
     # Waveforms are rescaled to different total masses and their overlaps computed
     # Returns an array of total masses and overlaps
     # {{{
-    # print min(wav1.rawhp), max(wav1.rawhp), max(wav2.rawhp), min(wav2.rawhp)
     if psd is None:
         raise IOError("Provide the PSD please!")
     if mf_lower < 0:
         print("Initial orbital frequencies will be deduced after blending")
     #
-    t2_opt = [1000, 2000]
-    t_option = [100, t2_opt[0], t2_opt[1], 50, 100]
-    f_lower = 15. - 0.5
-    # Calculate lowest total mass, from a) mf_lower, b) m_lower, c) calculate
-    if mf_lower > 0:
-        m_lower = mf_lower / f_lower / lal.MTSUN_SI
-    elif m_lower <= 0:
-        rescaled_mass, orbit_freq1 = wav1.get_orbital_frequency(t=max(t2_opt))
-        rescaled_mass, orbit_freq2 = wav2.get_orbital_frequency(t=max(t2_opt))
-        m_lower = max(orbit_freq1, orbit_freq2) * rescaled_mass / f_lower
-    print(orbit_freq1, orbit_freq2, "lowest total Mass = %f" % m_lower)
+    m_lower = lowest_totalmass_for_overlaps(wav1,
+                                            wav2,
+                                            mf_lower=mf_lower,
+                                            m_lower=m_lower)
     #
     overlaps = []
     mass_range = get_uniform_mass_range(m_lower, m_upper, m_delta)
     for mtot in mass_range:
-        #wav1.rescale_to_totalmass( mtot )
-        #wav2.rescale_to_totalmass( mtot )
-        wav_blended1 = blend(wav1, mtot, wav1.sample_rate, wav1.time_length,
-                             t_option)  # blending
-        wav_blended2 = blend(wav2, mtot, wav1.sample_rate, wav1.time_length,
-                             t_option)  # blending
-        if len(wav_blended1) != len(wav_blended2):
-            raise RuntimeError(
-                "blending function return different sets of waveforms!!")
-        tmp_overlaps = [mtot]
-        for ii in range(len(wav_blended1)):
-            hp1, hp2 = wav_blended1[ii], wav_blended2[ii]
-            olap = overlap_between_waveforms(hp1, hp2, psd=psd)
-            tmp_overlaps.append(olap)
-            print("--In OvsM: window %d, overlap = %f" % (ii, olap))
-        overlaps.append(tmp_overlaps)
+        overlaps.append(overlaps_at_totalmass(wav1, wav2, mtot, psd=psd))
     return overlaps
     # }}}
 
 
+# Pool workers for overlaps_vs_totalmass_grid. Each worker keeps the last
+# few waveforms it read, so that all masses of a pair cost one read.
+MAX_WAVEFORMS_PER_WORKER = 8
+overlap_worker = {}
+
+
+def init_overlap_worker(load_waveform, psd):
+    # Pool initializer. load_waveform(*key) returns the waveform for key
+    overlap_worker['load_waveform'] = load_waveform
+    overlap_worker['psd'] = psd
+    overlap_worker['waveforms'] = LRUCache(max_bytes=MAX_WAVEFORMS_PER_WORKER,
+                                           sizeof=lambda w: 1)
+
+
+def overlap_worker_waveform(key):
+    # {{{
+    waveforms = overlap_worker['waveforms']
+    wav = waveforms.get(key)
+    if wav is None:
+        wav = overlap_worker['load_waveform'](*key)
+        waveforms[key] = wav
+    return wav
+    # }}}
+
+
+def mass_range_of_pair(task):
+    key1, key2, mf_lower, m_lower, m_upper, m_delta = task
+    m_lower = lowest_totalmass_for_overlaps(overlap_worker_waveform(key1),
+                                            overlap_worker_waveform(key2),
+                                            mf_lower=mf_lower,
+                                            m_lower=m_lower)
+    return get_uniform_mass_range(m_lower, m_upper, m_delta)
+
+
+def overlaps_of_pair_at_mass(task):
+    idx, jdx, key1, key2, mtot = task
+    return idx, jdx, overlaps_at_totalmass(overlap_worker_waveform(key1),
+                                           overlap_worker_waveform(key2),
+                                           mtot,
+                                           psd=overlap_worker['psd'])
+
+
+def overlaps_vs_totalmass_grid(pairs,
+                               load_waveform,
+                               outputfile,
+                               psd=None,
+                               nprocs=1,
+                               mf_lower=-1.,
+                               m_lower=-1.,
+                               m_upper=100.,
+                               m_delta=5.,
+                               verbose=False):
+    # Compute overlaps_vs_totalmass for many pairs of waveforms, with every
+    # (pair, total mass) as a separate task on a pool of nprocs processes.
+    # pairs is a list of (group, dataset, key1, key2), and load_waveform(*key)
+    # returns the waveform for key. The overlaps of each pair are written to
+    # outputfile as group/dataset as soon as all its masses are done. Pairs
+    # whose dataset already exists are skipped, so that interrupted runs can
+    # be restarted.
+    # {{{
+    if psd is None:
+        raise IOError("Provide the PSD please!")
+    with h5py.File(outputfile, 'a') as fout:
+        todo = [(group, dsetname, key1, key2)
+                for (group, dsetname, key1, key2) in pairs
+                if group not in fout or dsetname not in fout[group]]
+    if verbose:
+        print("%d of %d overlap datasets to compute" %
+              (len(todo), len(pairs)),
+              file=sys.stderr)
+    if len(todo) == 0:
+        return
+    #
+    if nprocs > 1:
+        # load_waveform is a bound method of nr_run_cce, which the workers
+        # can only inherit when forked
+        pool = multiprocessing.get_context('fork').Pool(
+            nprocs,
+            initializer=init_overlap_worker,
+            initargs=(load_waveform, psd))
+        imap = pool.imap
+        imap_unordered = pool.imap_unordered
+    else:
+        pool = None
+        init_overlap_worker(load_waveform, psd)
+        imap = imap_unordered = map
+    try:
+        # Mass grid of every pair, then every (pair, mass) as a task
+        mass_ranges = list(
+            imap(mass_range_of_pair,
+                 [(key1, key2, mf_lower, m_lower, m_upper, m_delta)
+                  for (_, _, key1, key2) in todo]))
+        tasks = [(idx, jdx, todo[idx][2], todo[idx][3], mtot)
+                 for idx in range(len(todo))
+                 for jdx, mtot in enumerate(mass_ranges[idx])]
+        overlaps = [[None] * len(mass_range) for mass_range in mass_ranges]
+        remaining = [len(mass_range) for mass_range in mass_ranges]
+        for idx, jdx, tmp_overlaps in imap_unordered(overlaps_of_pair_at_mass,
+                                                     tasks):
+            overlaps[idx][jdx] = tmp_overlaps
+            remaining[idx] -= 1
+            if remaining[idx] > 0:
+                continue
+            # Add matches and masses as a dataset to the group
+            group, dsetname = todo[idx][:2]
+            with h5py.File(outputfile, 'a') as fout:
+                fout.require_group(group).create_dataset(dsetname,
+                                                         data=overlaps[idx])
+            overlaps[idx] = None
+            if verbose:
+                print("Wrote %s/%s" % (group, dsetname), file=sys.stderr)
+    except BaseException:
+        # Do not wait for the queued tasks on errors or interrupts
+        if pool is not None:
+            pool.terminate()
+        raise
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return
+    # }}}
+
+
 def overlap_between_waveforms(wav1, wav2, psd=None, f_lower=15.):
     # Return overlap between two TimeSEries with psd needed as a FrequencySeries
     # {{{
@@ -2103,6 +2250,25 @@ class nr_run_cce():
 
     #
 
+    def read_waveform_from_hdf5_file(
+            self,
+            ld,
+            ccef,
+            wavefilename='rhOverM_CcePITT_Asymptotic_GeometricUnits.h5'):
+        # Read the waveform of one CCE file at one Lev, from
+        # outdir/ld/wavefilename
+        # {{{
+        with h5py.File(self.outdir + '/' + ld + '/' + wavefilename,
+                       'r') as fin:
+            data = fin[ccef]['Y_l2_m2.dat'][()]
+        return UseNRinDA.nr_waveform(filename=data,
+                                     filetype='dataset',
+                                     sample_rate=self.sample_rate,
+                                     time_length=self.time_length)
+        # }}}
+
+    #
+
     def read_extrapolated_waveforms_from_hdf5_files(
             self,
             dirname=None,
@@ -2138,54 +2304,48 @@ class nr_run_cce():
             outputfile='OverlapsLevs.h5',
             catalogfile=None,
             m_upper=100.,
-            m_delta=5.):
+            m_delta=5.,
+            nprocs=1):
         # {{{
         cmd.getoutput('mkdir -p %s/%s' % (self.outdir, outdir))
-        fout = h5py.File(self.outdir + '/' + outdir + '/' + outputfile, "a")
         #
-        # Get the waveforms for different levs
-        self.read_waveforms_from_hdf5_files(wavefilename=wavefilename)
+        # List the CCE files at every Lev. Waveforms are read by the workers
+        # (with read_waveform_from_hdf5_file), once each.
+        self.levs.sort()
+        ccefiles = {}
+        for ld in self.levs:
+            with h5py.File(self.outdir + '/' + ld + '/' + wavefilename,
+                           'r') as fin:
+                ccefiles[ld] = list(fin.keys())
         # Get PSD
-        sample_rate, time_length = self.sample_rate, self.time_length
-        N = sample_rate * time_length
         self.psd = self.get_psd()
         #
-        ccefiles = list(self.wavefiles[self.levs[0]].keys())
-        #ccefiles = list(np.sort( self.ccefiles[self.levs[0]] )[num_runs:])
         # Obtain the waveform files for given CceR, at Lev3,4,5
         # In pairs, compare Lev3,4,5
-        self.levs.sort()
-        for ccef in ccefiles:
+        pairs = []
+        for ccef in ccefiles[self.levs[0]]:
             # choose a pair of levs
             for i1 in range(len(self.levs)):
                 ld1 = self.levs[i1]
                 for i2 in range(i1, len(self.levs)):  # Include self overlaps
                     ld2 = self.levs[i2]
-                    if ccef not in list(self.hwaveforms[ld1].keys()) or \
-                            ccef not in list(self.hwaveforms[ld2].keys()):
+                    if ccef not in ccefiles[ld1] or ccef not in ccefiles[ld2]:
                         print(ccef, " waveforms not found in both %s and %s" %
                               (ld1, ld2))
                         continue
-                    # Create a group in output file for this ccefile
-                    if ccef not in list(fout.keys()):
-                        fout.create_group(ccef)
-                    # Compute matches
-                    if self.verbose:
-                        print("\n\nOverlaps for %s Between %s and %s" %
-                              (ccef, ld1, ld2),
-                              file=sys.stderr)
-                    overlaps = overlaps_vs_totalmass(
-                        self.hwaveforms[ld1][ccef],
-                        self.hwaveforms[ld2][ccef],
-                        psd=self.psd,
-                        m_upper=m_upper,
-                        m_delta=m_delta)
-                    # Add matches and masses as a dataset to the group
-                    dsetname = ld1 + '_' + ld2 + '.dat'
-                    fout[ccef].create_dataset(dsetname, data=overlaps)
-        #
-        fout.flush()
-        fout.close()
+                    pairs.append((ccef, ld1 + '_' + ld2 + '.dat',
+                                  (ld1, ccef, wavefilename),
+                                  (ld2, ccef, wavefilename)))
+        #
+        overlaps_vs_totalmass_grid(pairs,
+                                   self.read_waveform_from_hdf5_file,
+                                   self.outdir + '/' + outdir + '/' +
+                                   outputfile,
+                                   psd=self.psd,
+                                   nprocs=nprocs,
+                                   m_upper=m_upper,
+                                   m_delta=m_delta,
+                                   verbose=self.verbose)
         return
         # }}}
 
@@ -8,6 +8,8 @@ logging.basicConfig(format='%(asctime)s | %(levelname)s : %(message)s',\
 import numpy as np
 import argparse
 
+from gwnr.analysis import manifest_entry, write_manifest
+
 from glue import gpstime
 from glue.ligolw import ligolw
 from glue.ligolw import table
@@ -80,6 +82,9 @@ parser.add_argument("--comment", help="Comment string to be stored in proc_id")
 parser.add_argument("-e",
                     "--named",
                     help="Starting string in the names of final XMLs")
+parser.add_argument("--index-file",
+                    help="""If given, write the number of templates and the
+                    chirp mass range of every sub-bank to this JSON file""")
 
 options = parser.parse_args()
 #}}}
@@ -127,6 +132,16 @@ else:
 if options.verbose:
     logging.info("Mchirp bin edges chosen are: {}".format(mc_bins_edges))
     sys.stdout.flush()
+
+# Assign every template to its bin in one pass. Templates in bin i have
+# mc_bins_edges[i] <= mchirp < mc_bins_edges[i + 1], those outside all bins
+# are dropped. A stable sort keeps the order of templates within each bin.
+bin_of_template = np.digitize(mchirps_in_bank, mc_bins_edges) - 1
+order = np.argsort(bin_of_template, kind='mergesort')
+bin_starts = np.searchsorted(bin_of_template[order],
+                             np.arange(len(mc_bins_edges)))
+
+index = {}
 for i in range(len(mc_bins_edges) - 1):
     # create a blank xml document and add points that fall within the i'th bin
     outdoc = ligolw.Document()
@@ -139,10 +154,11 @@ for i in range(len(mc_bins_edges) - 1):
         outdoc, PROGRAM_NAME, options.__dict__,
         comment=options.comment).process_id
 
-    for p in template_bank_table:
-        if p.mchirp >= mc_bins_edges[i] and p.mchirp < mc_bins_edges[i + 1]:
-            p.process_id = out_proc_id
-            new_inspiral_table.append(p)
+    rows_in_bin = order[bin_starts[i]:bin_starts[i + 1]]
+    for k in rows_in_bin:
+        p = template_bank_table[k]
+        p.process_id = out_proc_id
+        new_inspiral_table.append(p)
 
     if options.verbose:
         logging.info("\t {} templates in sub-bank {}.".format(\
@@ -153,5 +169,9 @@ for i in range(len(mc_bins_edges) - 1):
 
     outname = options.named + '%06d.xml' % i
     ligolw_utils.write_filename(outdoc, outname)
+    index[outname] = manifest_entry(mchirps_in_bank[rows_in_bin])
+
+if options.index_file:
+    write_manifest(options.index_file, index)
 
 logging.info("{}".format(i))
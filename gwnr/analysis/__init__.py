@@ -4,3 +4,4 @@ from .filter import *
 from .gw_transient_catalog import *
 from .psd import *
 from .utils import *
+from .banksim import *
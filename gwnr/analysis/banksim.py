@@ -0,0 +1,615 @@
+# Copyright (C) 2021 Prayush Kumar
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 3 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General
+# Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+# =============================================================================
+#
+#                                   Preamble
+#
+# =============================================================================
+#
+"""Reading and writing of the match files of bank simulations"""
+
+import os
+import json
+import time
+from itertools import islice
+import numpy as np
+import h5py
+
+MATCH_FILE_FORMATS = ['text', 'hdf']
+
+# Columns of binary match files
+MATCH_FILE_COLUMNS = [('template_index', np.int64),
+                      ('proposal_index', np.int64), ('match', np.float64),
+                      ('template_sigma', np.float64),
+                      ('proposal_sigma', np.float64)]
+
+
+def match_file_format(file_name):
+    """Guess the format of a match file, from its contents if it exists and
+    from its extension otherwise"""
+    if os.path.exists(file_name) and os.path.getsize(file_name) > 0:
+        return 'hdf' if h5py.is_hdf5(file_name) else 'text'
+    if os.path.splitext(file_name)[-1] in ['.hdf', '.h5', '.hdf5']:
+        return 'hdf'
+    return 'text'
+
+
+class MatchWriter(object):
+    """
+Buffered writer of (template, proposal, match, template sigma, proposal
+sigma) records. Records are written out every `flush_every` records or
+`flush_interval` seconds, whichever comes first, and on `close`.
+
+Two formats are supported:
+
+ - 'text': one tab-separated line per record, with templates and
+   proposals tagged as "<file name>:<row index>",
+ - 'hdf': one resizable dataset per column (see MATCH_FILE_COLUMNS), with
+   the bank and proposal file names stored as attributes.
+
+Existing files are appended to in both cases.
+
+Parameters
+----------
+file_name: str
+    Output match file
+bank_file_name, prop_file_name: str
+    Files that row indices refer to
+file_format: str
+    One of MATCH_FILE_FORMATS. Guessed from the extension if not given.
+flush_every: int
+    Maximum number of buffered records. None means no limit.
+flush_interval: float
+    Maximum time (in seconds) records stay buffered. None means no limit.
+    """
+    def __init__(self,
+                 file_name,
+                 bank_file_name,
+                 prop_file_name,
+                 file_format=None,
+                 flush_every=1000,
+                 flush_interval=60.):
+        # {{{
+        if file_format is None:
+            file_format = match_file_format(file_name)
+        if file_format not in MATCH_FILE_FORMATS:
+            raise IOError("Match file format {} not one of {}".format(
+                file_format, MATCH_FILE_FORMATS))
+        self.file_name = file_name
+        self.bank_file_name = bank_file_name
+        self.prop_file_name = prop_file_name
+        self.file_format = file_format
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.num_written = 0
+        self._buffer = []
+        self._last_flush = time.time()
+        if file_format == 'hdf':
+            self._init_hdf()
+        else:
+            open(file_name, 'a').close()
+        # }}}
+
+    def _init_hdf(self):
+        with h5py.File(self.file_name, 'a') as fout:
+            fout.attrs['bank_file'] = self.bank_file_name
+            fout.attrs['proposal_file'] = self.prop_file_name
+            for name, dtype in MATCH_FILE_COLUMNS:
+                if name not in fout:
+                    fout.create_dataset(name, (0, ),
+                                        maxshape=(None, ),
+                                        chunks=True,
+                                        dtype=dtype)
+
+    def __len__(self):
+        return len(self._buffer)
+
+    def append(self, bank_idx, prop_idx, mval, norm_b=-1.0, norm_s=-1.0):
+        """Buffer one record, flushing if the buffer is due"""
+        self._buffer.append((bank_idx, prop_idx, mval, norm_b, norm_s))
+        if (self.flush_every and len(self._buffer) >= self.flush_every) or \
+                (self.flush_interval is not None and
+                 time.time() - self._last_flush >= self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        """Write out all buffered records"""
+        # {{{
+        self._last_flush = time.time()
+        if len(self._buffer) == 0:
+            return
+        if self.file_format == 'hdf':
+            records = np.array(self._buffer, dtype=MATCH_FILE_COLUMNS)
+            with h5py.File(self.file_name, 'a') as fout:
+                for name, _ in MATCH_FILE_COLUMNS:
+                    dset = fout[name]
+                    old_len = len(dset)
+                    dset.resize((old_len + len(records), ))
+                    dset[old_len:] = records[name]
+        else:
+            with open(self.file_name, 'a') as fout:
+                for bidx, pidx, mval, norm_b, norm_s in self._buffer:
+                    fout.write(
+                        "{0}:{1}\t{2}:{3}\t{4:.12e}\t{5:.12e}\t{6:.12e}\n".
+                        format(self.bank_file_name, bidx, self.prop_file_name,
+                               pidx, mval, norm_b, norm_s))
+        self.num_written += len(self._buffer)
+        self._buffer = []
+        # }}}
+
+    def size(self):
+        """Size of the match file, in bytes for text files and in records
+        for HDF files. Buffered records are not counted."""
+        if self.file_format == 'hdf':
+            with h5py.File(self.file_name, 'r') as fin:
+                return len(fin[MATCH_FILE_COLUMNS[0][0]])
+        return os.path.getsize(self.file_name)
+
+    def truncate(self, size):
+        """Drop everything beyond `size` (as returned by `size`) from the
+        match file, and discard buffered records"""
+        self._buffer = []
+        if self.file_format == 'hdf':
+            with h5py.File(self.file_name, 'a') as fout:
+                for name, _ in MATCH_FILE_COLUMNS:
+                    fout[name].resize((size, ))
+        else:
+            with open(self.file_name, 'r+') as fout:
+                fout.truncate(size)
+
+    def close(self):
+        self.flush()
+
+
+class MatchCheckpoint(object):
+    """
+Sidecar checkpoint of a match file, which records the (bank batch,
+proposal batch) blocks that have been completed, and the size of the
+match file when the last of them was.
+
+On restart, `restore` truncates the match file back to that size,
+dropping whatever part of an unfinished block had been written, so that
+skipping the blocks for which `is_done` is True neither duplicates nor
+recomputes any pair.
+
+Parameters
+----------
+match_writer: MatchWriter
+    Writer of the match file being checkpointed
+run_info: dict
+    Settings the checkpoint is only valid for, e.g. input files and batch
+    sizes. A checkpoint written with different settings is rejected.
+file_name: str
+    Checkpoint file. Defaults to the match file name + '.ckpt'.
+    """
+    def __init__(self, match_writer, run_info=None, file_name=None):
+        # {{{
+        if file_name is None:
+            file_name = match_writer.file_name + '.ckpt'
+        self.file_name = file_name
+        self.match_writer = match_writer
+        self.run_info = run_info if run_info is not None else {}
+        self.blocks = set()
+        self.size = None
+        if os.path.exists(file_name):
+            with open(file_name, 'r') as fin:
+                ckpt = json.load(fin)
+            if ckpt['run_info'] != json.loads(json.dumps(self.run_info)):
+                raise IOError(
+                    "Checkpoint {} was written for different settings: {}".
+                    format(file_name, ckpt['run_info']))
+            self.blocks = set(tuple(b) for b in ckpt['blocks'])
+            self.size = ckpt['size']
+        else:
+            # Anything already in the match file predates this checkpoint
+            self.size = match_writer.size()
+            self._write()
+        # }}}
+
+    def __len__(self):
+        return len(self.blocks)
+
+    def is_done(self, i, j):
+        return (i, j) in self.blocks
+
+    def restore(self):
+        """Truncate the match file to its size at the last checkpoint"""
+        self.match_writer.truncate(self.size)
+
+    def mark_done(self, i, j):
+        """Flush the match file and record block (i, j) as complete"""
+        self.match_writer.flush()
+        self.blocks.add((i, j))
+        self.size = self.match_writer.size()
+        self._write()
+
+    def _write(self):
+        # Write to a temporary file first, so that a job killed while
+        # checkpointing never leaves a corrupt checkpoint behind
+        tmp_file_name = self.file_name + '.tmp'
+        with open(tmp_file_name, 'w') as fout:
+            json.dump(
+                {
+                    'run_info': self.run_info,
+                    'blocks': sorted(self.blocks),
+                    'size': self.size
+                }, fout)
+        os.rename(tmp_file_name, self.file_name)
+
+
+######################################################################
+#      Reading and combining match files
+
+
+def _as_str(val):
+    return val.decode() if isinstance(val, bytes) else str(val)
+
+
+def _split_tag(tag):
+    name, _, idx = tag.rpartition(':')
+    return name, int(idx)
+
+
+def iter_match_file(file_name, chunk_size=100000, file_format=None):
+    """
+Read a match file in chunks of at most `chunk_size` records, so that
+files of any size are read in bounded memory.
+
+Yields tuples of (bank file name, proposal file name, records), where
+records is a structured array with the columns of MATCH_FILE_COLUMNS.
+Text files that tag rows with several file names yield one tuple per
+(bank file, proposal file) pair in each chunk.
+    """
+    # {{{
+    if not os.path.exists(file_name):
+        raise IOError("Provided file {} not found.".format(file_name))
+    if file_format is None:
+        file_format = match_file_format(file_name)
+    if file_format == 'hdf':
+        with h5py.File(file_name, 'r') as fin:
+            bank_file_name = _as_str(fin.attrs['bank_file'])
+            prop_file_name = _as_str(fin.attrs['proposal_file'])
+            num_records = len(fin[MATCH_FILE_COLUMNS[0][0]])
+            for start in range(0, num_records, chunk_size):
+                stop = min(start + chunk_size, num_records)
+                records = np.zeros(stop - start, dtype=MATCH_FILE_COLUMNS)
+                for name, _ in MATCH_FILE_COLUMNS:
+                    records[name] = fin[name][start:stop]
+                yield bank_file_name, prop_file_name, records
+        return
+    with open(file_name, 'r') as fin:
+        while True:
+            lines = [line.split() for line in islice(fin, chunk_size)]
+            if len(lines) == 0:
+                break
+            lines = [line for line in lines if len(line) >= 5]
+            if len(lines) == 0:
+                continue
+            records = np.zeros(len(lines), dtype=MATCH_FILE_COLUMNS)
+            bank_tags = [_split_tag(line[0]) for line in lines]
+            prop_tags = [_split_tag(line[1]) for line in lines]
+            records['template_index'] = [t[1] for t in bank_tags]
+            records['proposal_index'] = [t[1] for t in prop_tags]
+            values = np.array([line[2:5] for line in lines], dtype=float)
+            records['match'] = values[:, 0]
+            records['template_sigma'] = values[:, 1]
+            records['proposal_sigma'] = values[:, 2]
+            pairs = [(b[0], p[0]) for b, p in zip(bank_tags, prop_tags)]
+            if all(pair == pairs[0] for pair in pairs):
+                yield pairs[0][0], pairs[0][1], records
+                continue
+            groups = {}
+            for i, pair in enumerate(pairs):
+                groups.setdefault(pair, []).append(i)
+            for (bank_file_name, prop_file_name), rows in groups.items():
+                yield bank_file_name, prop_file_name, records[rows]
+    # }}}
+
+
+class _RunningBest(object):
+    """
+Best match (and its partner and sigmas) seen so far for each row of one
+file, in arrays indexed by row that grow as larger rows are seen
+    """
+    def __init__(self):
+        self.match = np.full(0, -np.inf)
+        self.partner_file = np.zeros(0, dtype=np.int32)
+        self.partner_index = np.zeros(0, dtype=np.int64)
+        self.template_sigma = np.zeros(0)
+        self.proposal_sigma = np.zeros(0)
+
+    def _grow(self, size):
+        old_size = len(self.match)
+        if size <= old_size:
+            return
+        size = max(size, 2 * old_size)
+        for name, fill in [('match', -np.inf), ('partner_file', -1),
+                           ('partner_index', 0), ('template_sigma', 0),
+                           ('proposal_sigma', 0)]:
+            old = getattr(self, name)
+            new = np.full(size, fill, dtype=old.dtype)
+            new[:old_size] = old
+            setattr(self, name, new)
+
+    def update(self, rows, partner_file, partner_index, records):
+        """Keep, for each of `rows`, the record with the larger match. Ties
+        keep the record seen first."""
+        # Best record of each row within this chunk. lexsort is stable, so
+        # the first of tied records wins
+        order = np.lexsort((-records['match'], rows))
+        rows = rows[order]
+        first = np.ones(len(rows), dtype=bool)
+        first[1:] = rows[1:] != rows[:-1]
+        order, rows = order[first], rows[first]
+        self._grow(rows.max() + 1)
+        mvals = records['match'][order]
+        better = mvals > self.match[rows]
+        rows, order = rows[better], order[better]
+        self.match[rows] = mvals[better]
+        self.partner_file[rows] = partner_file
+        self.partner_index[rows] = partner_index[order]
+        self.template_sigma[rows] = records['template_sigma'][order]
+        self.proposal_sigma[rows] = records['proposal_sigma'][order]
+
+    def seen(self):
+        """Rows for which a record has been seen"""
+        return np.flatnonzero(self.partner_file >= 0)
+
+
+class BestMatches(object):
+    """
+Streaming combiner of match files. Keeps only the running best match for
+each proposal (and, with `per_template`, for each template), keyed by
+integer row indices, instead of every record read.
+
+Usage
+-----
+best = BestMatches()
+for f in match_files:
+    best.add_file(f)
+best.write('combined.dat')
+    """
+    def __init__(self, per_template=False):
+        self.per_template = per_template
+        self.file_names = []
+        self._file_ids = {}
+        self.best_for_proposals = {}
+        self.best_for_templates = {}
+
+    def _file_id(self, file_name):
+        if file_name not in self._file_ids:
+            self._file_ids[file_name] = len(self.file_names)
+            self.file_names.append(file_name)
+        return self._file_ids[file_name]
+
+    def update(self, bank_file_name, prop_file_name, records):
+        """Fold in records between rows of the two given files"""
+        if len(records) == 0:
+            return
+        bank_id = self._file_id(bank_file_name)
+        prop_id = self._file_id(prop_file_name)
+        if prop_id not in self.best_for_proposals:
+            self.best_for_proposals[prop_id] = _RunningBest()
+        self.best_for_proposals[prop_id].update(records['proposal_index'],
+                                                bank_id,
+                                                records['template_index'],
+                                                records)
+        if self.per_template:
+            if bank_id not in self.best_for_templates:
+                self.best_for_templates[bank_id] = _RunningBest()
+            self.best_for_templates[bank_id].update(
+                records['template_index'], prop_id,
+                records['proposal_index'], records)
+
+    def add_file(self, file_name, chunk_size=100000):
+        """Fold in all records of a match file, in either format"""
+        for bank_file_name, prop_file_name, records in iter_match_file(
+                file_name, chunk_size=chunk_size):
+            self.update(bank_file_name, prop_file_name, records)
+
+    def _iter(self, best, rows_are_proposals):
+        for file_id in sorted(best):
+            running = best[file_id]
+            for row in running.seen():
+                other = (self.file_names[running.partner_file[row]],
+                         running.partner_index[row])
+                this = (self.file_names[file_id], row)
+                bank, prop = (other, this) if rows_are_proposals else \
+                    (this, other)
+                yield (bank[0], int(bank[1]), prop[0], int(prop[1]),
+                       running.match[row], running.template_sigma[row],
+                       running.proposal_sigma[row])
+
+    def proposals(self):
+        """
+        Iterate over the best match of every proposal seen, as tuples of
+        (bank file, template index, proposal file, proposal index, match,
+        template sigma, proposal sigma)
+        """
+        return self._iter(self.best_for_proposals, True)
+
+    def templates(self):
+        """As `proposals`, for the best match of every template seen. Only
+        available with `per_template`."""
+        if not self.per_template:
+            raise IOError("Best matches per template were not kept")
+        return self._iter(self.best_for_templates, False)
+
+    def write(self, file_name, per_template=False):
+        """
+        Write the best matches, one per proposal (or per template), as a
+        text match file
+        """
+        best = self.templates() if per_template else self.proposals()
+        with open(file_name, 'w') as fout:
+            for bank, bidx, prop, pidx, mval, norm_b, norm_s in best:
+                fout.write(
+                    "{0}:{1}\t{2}:{3}\t{4:.12e}\t{5:.12e}\t{6:.12e}\n".format(
+                        bank, bidx, prop, pidx, mval, norm_b, norm_s))
+
+
+######################################################################
+#      Manifests of split tables
+
+
+def manifest_entry(mchirp, tau0=None):
+    """
+    Summary of one table file for a manifest: its number of rows, and the
+    ranges of the given per-row chirp masses (and tau0s). Ranges of empty
+    tables are None.
+    """
+    mchirp = np.asarray(mchirp, dtype=float)
+    entry = {'count': len(mchirp), 'mchirp_min': None, 'mchirp_max': None}
+    if len(mchirp):
+        entry['mchirp_min'] = float(mchirp.min())
+        entry['mchirp_max'] = float(mchirp.max())
+    if tau0 is not None:
+        tau0 = np.asarray(tau0, dtype=float)
+        entry['tau0_min'] = float(tau0.min()) if len(tau0) else None
+        entry['tau0_max'] = float(tau0.max()) if len(tau0) else None
+    return entry
+
+
+MANIFEST_COLUMNS = ['count', 'mchirp_min', 'mchirp_max', 'tau0_min', 'tau0_max']
+
+
+def manifest_from_files(file_names, f_lower=15.):
+    """
+    Build manifest entries for sim_inspiral / sngl_inspiral XML files,
+    parsing each file once
+    """
+    # {{{
+    from glue.ligolw import ligolw, lsctables, table
+    from glue.ligolw import utils as ligolw_utils
+    from .utils import mchirp_tau0_from_table
+    entries = {}
+    for file_name in file_names:
+        indoc = ligolw_utils.load_filename(
+            file_name,
+            contenthandler=table.use_in(ligolw.LIGOLWContentHandler))
+        try:
+            tab = lsctables.SimInspiralTable.get_table(indoc)
+        except ValueError:
+            tab = lsctables.SnglInspiralTable.get_table(indoc)
+        if len(tab) == 0:
+            entries[file_name] = manifest_entry([], [])
+            continue
+        mchirp, tau0 = mchirp_tau0_from_table(tab, f_lower)
+        entries[file_name] = manifest_entry(mchirp, tau0)
+    return entries
+    # }}}
+
+
+def split_table_by_mchirp(file_name, rows_per_file, out_prefix,
+                          f_lower=15., program_name='gwnr'):
+    """
+    Split the sim_inspiral / sngl_inspiral table of an XML file into files
+    named `out_prefix` + '<i>.xml' of `rows_per_file` rows each, in
+    ascending order of chirp mass (as pycbc_splitbank --sort-mchirp does).
+
+    The manifest entries of the files are computed from the sorted table as
+    they are written, and returned as a dict of {file name: entry} ready for
+    `write_manifest`, so that the files need not be parsed again.
+    """
+    # {{{
+    from glue.ligolw import ligolw, lsctables, table
+    from glue.ligolw import utils as ligolw_utils
+    from glue.ligolw.utils import process as ligolw_process
+    from .utils import mchirp_tau0_from_table
+    indoc = ligolw_utils.load_filename(
+        file_name, contenthandler=table.use_in(ligolw.LIGOLWContentHandler))
+    try:
+        tab = lsctables.SimInspiralTable.get_table(indoc)
+        tabletype = lsctables.SimInspiralTable
+    except ValueError:
+        tab = lsctables.SnglInspiralTable.get_table(indoc)
+        tabletype = lsctables.SnglInspiralTable
+    mchirp, tau0 = mchirp_tau0_from_table(tab, f_lower)
+    order = np.argsort(mchirp, kind='mergesort')
+
+    entries = {}
+    num_files = int(np.ceil(len(tab) / float(rows_per_file)))
+    for i in range(num_files):
+        rows = order[i * rows_per_file:(i + 1) * rows_per_file]
+        outdoc = ligolw.Document()
+        outdoc.appendChild(ligolw.LIGO_LW())
+        out_table = lsctables.New(tabletype, columns=tab.columnnames)
+        outdoc.childNodes[0].appendChild(out_table)
+        out_proc_id = ligolw_process.register_to_xmldoc(
+            outdoc, program_name, {}).process_id
+        for k in rows:
+            row = tab[k]
+            row.process_id = out_proc_id
+            out_table.append(row)
+        out_name = out_prefix + str(i) + '.xml'
+        ligolw_utils.write_filename(outdoc, out_name)
+        entries[out_name] = manifest_entry(mchirp[rows], tau0[rows])
+    return entries
+    # }}}
+
+
+def write_manifest(file_name, entries):
+    """
+    Write a manifest, i.e. a dict of {table file name: entry} with entries
+    made by `manifest_entry`. Files with an HDF extension get one dataset
+    per column of MANIFEST_COLUMNS, plus 'file_name', with missing values
+    stored as NaN. Other files are written as JSON.
+    """
+    # {{{
+    if match_file_format(file_name) != 'hdf':
+        with open(file_name, 'w') as fout:
+            json.dump(entries, fout, indent=1, sort_keys=True)
+        return
+    names = sorted(entries)
+    with h5py.File(file_name, 'w') as fout:
+        fout.create_dataset('file_name',
+                            data=np.array(names, dtype=object),
+                            dtype=h5py.special_dtype(vlen=str))
+        for col in MANIFEST_COLUMNS:
+            vals = [entries[n].get(col) for n in names]
+            if col == 'count':
+                fout.create_dataset(col, data=np.array(vals, dtype=np.int64))
+            else:
+                fout.create_dataset(col,
+                                    data=np.array(
+                                        [np.nan if v is None else v
+                                         for v in vals],
+                                        dtype=np.float64))
+    # }}}
+
+
+def read_manifest(file_name):
+    """Read a manifest written by `write_manifest`"""
+    # {{{
+    if match_file_format(file_name) != 'hdf':
+        with open(file_name, 'r') as fin:
+            return json.load(fin)
+    entries = {}
+    with h5py.File(file_name, 'r') as fin:
+        names = [_as_str(n) for n in fin['file_name'][:]]
+        columns = dict((col, fin[col][:]) for col in MANIFEST_COLUMNS
+                       if col in fin)
+    for i, name in enumerate(names):
+        entry = {}
+        for col, vals in columns.items():
+            if col == 'count':
+                entry[col] = int(vals[i])
+            else:
+                entry[col] = None if np.isnan(vals[i]) else float(vals[i])
+        entries[name] = entry
+    return entries
+    # }}}
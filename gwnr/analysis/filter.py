@@ -25,13 +25,29 @@ from __future__ import print_function
 from gwnr.utils.support import *
 import os
 import sys
+import logging
 import numpy as np
+from multiprocessing import Pool
+from multiprocessing.sharedctypes import RawArray
+from pyswarm import pso
+try:
+    import scipy.fft as _fft
+    _FFT_HAS_WORKERS = True
+except ImportError:
+    import numpy.fft as _fft
+    _FFT_HAS_WORKERS = False
 
-from pycbc.psd import from_string
+from gwnr.analysis.psd import cached_psd_from_string
 from pycbc.filter import match, make_frequency_series
+from pycbc.filter import get_cutoff_indices
+from pycbc.filter.matchedfilter import correlate
+from pycbc.types import (TimeSeries, FrequencySeries, zeros,
+                         complex_same_precision_as)
+from pycbc.fft import fft, ifft
 import pycbc.pnutils as pnutils
 import pycbc.waveform.generator as pywfg
 import pycbc.waveform as pywf
+import lal
 
 from glue.ligolw import lsctables
 from glue.ligolw import ligolw
@@ -45,6 +61,169 @@ class LIGOLWContentHandler(ligolw.LIGOLWContentHandler):
 ######################################################################
 #      Overlap and Fitting Factor
 
+DETECTOR_FRAME_VARIABLE_ARGS = [
+    'mass1', 'mass2', 'spin1x', 'spin1y', 'spin1z', 'spin2x', 'spin2y',
+    'spin2z', 'coa_phase', 'tc', 'ra', 'dec', 'polarization'
+]
+
+
+class MatchContext(object):
+    """
+Holds everything that stays fixed across repeated match calculations
+at a given PSD, lower frequency cutoff, sample rate and signal duration:
+
+ - the PSD itself,
+ - waveform generators, one per approximant and set of fixed arguments,
+ - zero-padded time- and frequency-domain work buffers,
+ - the frequency index range [kmin, kmax) used by the filters.
+
+Create one per sweep and pass it to `calculate_faithfulness` and
+`calculate_fitting_factor` through their `match_context` argument.
+
+NOTE: `pad` writes into a named buffer that is reused on the next call
+with the same name. Copy the result if it needs to outlive that call.
+    """
+    def __init__(self,
+                 f_lower=15.0,
+                 sample_rate=4096,
+                 signal_duration=256,
+                 psd_string='aLIGOZeroDetHighPower',
+                 psd=None):
+        # {{{
+        self.f_lower = f_lower
+        self.sample_rate = int(sample_rate)
+        self.signal_duration = int(signal_duration)
+        self.filter_N = self.signal_duration * self.sample_rate
+        self.filter_n = self.filter_N // 2 + 1
+        self.delta_t = 1. / self.sample_rate
+        self.delta_f = 1. / self.signal_duration
+        if psd is None:
+            psd = cached_psd_from_string(psd_string, self.filter_n,
+                                         self.delta_f, f_lower)
+        elif len(psd) != self.filter_n:
+            raise IOError("PSD has length %d, expected %d" %
+                          (len(psd), self.filter_n))
+        self.psd = psd
+        self.kmin, self.kmax = get_cutoff_indices(f_lower, None,
+                                                  self.delta_f, self.filter_N)
+        self._generators = {}
+        self._buffers = {}
+        self._td_buffers = {}
+        cdtype = complex_same_precision_as(psd)
+        self._snr = zeros(self.filter_N, dtype=cdtype)
+        self._corr = zeros(self.filter_N, dtype=cdtype)
+        # }}}
+
+    def get_generator(self,
+                      approximant,
+                      variable_args=DETECTOR_FRAME_VARIABLE_ARGS,
+                      **static_args):
+        """
+        Return a detector-frame generator for `approximant`, building it
+        only the first time a given set of arguments is requested.
+        """
+        # {{{
+        key = (approximant, tuple(variable_args),
+               tuple(sorted(static_args.items())))
+        if key in self._generators:
+            return self._generators[key]
+        if approximant in pywf.fd_approximants():
+            generator = pywfg.FDomainDetFrameGenerator(
+                pywfg.FDomainCBCGenerator,
+                0,
+                variable_args=list(variable_args),
+                detectors=['H1'],
+                delta_f=self.delta_f,
+                f_lower=self.f_lower,
+                approximant=approximant,
+                **static_args)
+        elif approximant in pywf.td_approximants():
+            generator = pywfg.TDomainDetFrameGenerator(
+                pywfg.TDomainCBCGenerator,
+                0,
+                variable_args=list(variable_args),
+                detectors=['H1'],
+                delta_t=self.delta_t,
+                f_lower=self.f_lower,
+                approximant=approximant,
+                **static_args)
+        else:
+            raise IOError("Approximant %s not found.." % approximant)
+        self._generators[key] = generator
+        return generator
+        # }}}
+
+    def pad(self, wav, name, force_fit=False):
+        """
+        Copy `wav` into the work buffer `name` as a FrequencySeries of
+        length filter_n. TimeSeries are zero-padded to filter_N and Fourier
+        transformed into that buffer, FrequencySeries are copied and
+        zero-padded.
+        """
+        # {{{
+        if name not in self._buffers:
+            self._buffers[name] = FrequencySeries(
+                zeros(self.filter_n, dtype=complex_same_precision_as(wav)),
+                delta_f=self.delta_f)
+        buf = self._buffers[name]
+        if isinstance(wav, TimeSeries):
+            if len(wav) > self.filter_N:
+                raise IOError(
+                    "Passed TimeSeries has length %d, cannot shrink to %d" %
+                    (len(wav), self.filter_N))
+            if name not in self._td_buffers:
+                self._td_buffers[name] = TimeSeries(zeros(self.filter_N,
+                                                          dtype=wav.dtype),
+                                                    delta_t=self.delta_t)
+            tbuf = self._td_buffers[name]
+            tbuf.data[:len(wav)] = wav.data
+            tbuf.data[len(wav):] = 0
+            tbuf._epoch = wav._epoch
+            fft(tbuf, buf)
+            return buf
+        if len(wav) > self.filter_n:
+            if not force_fit:
+                raise IOError(
+                    "Passed FrequencySeries has length %d, cannot shrink to %d"
+                    % (len(wav), self.filter_n))
+            print(("WARNING: Ignoring high-frequency content above %.3f Hz" %
+                   (wav.delta_f * self.filter_n)))
+        cplen = min(len(wav), self.filter_n)
+        buf.data[:cplen] = wav.data[:cplen]
+        buf.data[cplen:] = 0
+        buf._epoch = wav._epoch
+        return buf
+        # }}}
+
+    def sigmasq(self, vec):
+        """Squared norm of `vec` weighted by the context PSD, as
+        pycbc.filter.sigmasq computes it within [kmin, kmax)"""
+        v = vec[self.kmin:self.kmax]
+        return v.weighted_inner(v, self.psd[self.kmin:self.kmax]).real * \
+            4.0 * self.delta_f
+
+    def match(self, vec1, vec2, v1_norm=None, v2_norm=None):
+        """
+        Same as pycbc.filter.match, with both inputs already padded to
+        filter_n, but filtering over the context's [kmin, kmax) into
+        preallocated buffers. Pass the squared norms `v1_norm` / `v2_norm`
+        if they are already known.
+        """
+        # {{{
+        kmin, kmax = self.kmin, self.kmax
+        self._corr.clear()
+        correlate(vec1[kmin:kmax], vec2[kmin:kmax], self._corr[kmin:kmax])
+        self._corr[kmin:kmax] /= self.psd[kmin:kmax]
+        ifft(self._corr, self._snr)
+        maxsnr, max_id = self._snr.abs_max_loc()
+        if v1_norm is None:
+            v1_norm = self.sigmasq(vec1)
+        if v2_norm is None:
+            v2_norm = self.sigmasq(vec2)
+        return maxsnr * 4.0 * self.delta_f / np.sqrt(v1_norm * v2_norm), \
+            max_id
+        # }}}
+
 
 def calculate_faithfulness(m1,
                            m2,
@@ -70,7 +249,8 @@ def calculate_faithfulness(m1,
                            signal_duration=256,
                            psd_string='aLIGOZeroDetHighPower',
                            verbose=True,
-                           debug=False):
+                           debug=False,
+                           match_context=None):
     """
 Calculates the match for a signal of given physical
 parameters, as modelled by a given signal approximant, against
@@ -79,6 +259,10 @@ templates of another approximant.
 This function allows turning off x,y components of
 spin for templates.
 
+If a `MatchContext` is passed as `match_context`, its PSD, generators
+and buffers are reused, and `f_lower`, `sample_rate`, `signal_duration`
+and `psd_string` are ignored in favor of the context's settings.
+
 IN PROGRESS: Adding facility to use "FromDataFile" waveforms
     """
     # {{{
@@ -89,41 +273,21 @@ IN PROGRESS: Adding facility to use "FromDataFile" waveforms
         )
 
     # 1) GENERATE FILTERING META-PARAMETERS
-    filter_N = signal_duration * sample_rate
-    filter_n = filter_N / 2 + 1
-    delta_t = 1. / sample_rate
-    delta_f = 1. / signal_duration
-    # LIGO Noise PSD
-    psd = from_string(psd_string, filter_n, delta_f, f_lower)
+    if match_context is None:
+        match_context = MatchContext(f_lower=f_lower,
+                                     sample_rate=sample_rate,
+                                     signal_duration=signal_duration,
+                                     psd_string=psd_string)
+    ctx = match_context
+    f_lower = ctx.f_lower
+    filter_N = ctx.filter_N
+    delta_t = ctx.delta_t
 
     # 2) GENERATE THE TARGET SIGNAL
     # Get the signal waveform first
-    if signal_approx in pywf.fd_approximants():
-        generator = pywfg.FDomainDetFrameGenerator(
-            pywfg.FDomainCBCGenerator,
-            0,
-            variable_args=[
-                'mass1', 'mass2', 'spin1x', 'spin1y', 'spin1z', 'spin2x',
-                'spin2y', 'spin2z', 'coa_phase', 'tc', 'ra', 'dec',
-                'polarization'
-            ],
-            detectors=['H1'],
-            delta_f=delta_f,
-            f_lower=f_lower,
-            approximant=signal_approx)
-    elif signal_approx in pywf.td_approximants():
-        generator = pywfg.TDomainDetFrameGenerator(
-            pywfg.TDomainCBCGenerator,
-            0,
-            variable_args=[
-                'mass1', 'mass2', 'spin1x', 'spin1y', 'spin1z', 'spin2x',
-                'spin2y', 'spin2z', 'coa_phase', 'tc', 'ra', 'dec',
-                'polarization'
-            ],
-            detectors=['H1'],
-            delta_t=delta_t,
-            f_lower=f_lower,
-            approximant=signal_approx)
+    if signal_approx in pywf.fd_approximants() or \
+            signal_approx in pywf.td_approximants():
+        generator = ctx.get_generator(signal_approx)
     elif 'FromDataFile' in signal_approx:
         if os.path.getsize(signal_file) == 0:
             raise RuntimeError(" ERROR:...OOPS. Waveform file %s empty!!" %
@@ -154,15 +318,14 @@ IN PROGRESS: Adding facility to use "FromDataFile" waveforms
                                                   -1,
                                                   waveform_params,
                                                   f_lower,
-                                                  sample_rate,
+                                                  ctx.sample_rate,
                                                   filter_N,
                                                   datafile=signal_file)
             print(".. generated signal waveform ")
             m1, m2, w_value, _ = _params
             waveform_params.mass1 = m1
             waveform_params.mass2 = m2
-            signal_h = make_frequency_series(signal_htilde)
-            signal_h = extend_waveform_FrequencySeries(signal_h, filter_n)
+            signal_h = ctx.pad(signal_htilde, 'signal')
         # except: raise IOError("Approximant %s not found.." % signal_approx)
     else:
         raise IOError("Signal Approximant %s not found.." % signal_approx)
@@ -178,17 +341,14 @@ IN PROGRESS: Adding facility to use "FromDataFile" waveforms
                                               polarization)
         # NOTE: SEOBNRv4 has extra high frequency content, it seems..
         if 'SEOBNRv4_ROM' in signal_approx or 'SEOBNRv2_ROM' in signal_approx:
-            signal_h = extend_waveform_FrequencySeries(signal['H1'],
-                                                       filter_n,
-                                                       force_fit=True)
+            signal_h = ctx.pad(signal['H1'], 'signal', force_fit=True)
         else:
-            signal_h = extend_waveform_FrequencySeries(signal['H1'], filter_n)
+            signal_h = ctx.pad(signal['H1'], 'signal')
     elif signal_approx in pywf.td_approximants():
         signal = generator.generate_from_args(m1, m2, s1x, s1y, s1z, s2x, s2y,
                                               s2z, phic, tc, ra, dec,
                                               polarization)
-        signal_h = make_frequency_series(signal['H1'])
-        signal_h = extend_waveform_FrequencySeries(signal_h, filter_n)
+        signal_h = ctx.pad(signal['H1'], 'signal')
     elif 'FromDataFile' in signal_approx:
         pass
     else:
@@ -196,32 +356,9 @@ IN PROGRESS: Adding facility to use "FromDataFile" waveforms
 
     # 3) GENERATE THE TARGET TEMPLATE
     # Get the signal waveform first
-    if tmplt_approx in pywf.fd_approximants():
-        generator = pywfg.FDomainDetFrameGenerator(
-            pywfg.FDomainCBCGenerator,
-            0,
-            variable_args=[
-                'mass1', 'mass2', 'spin1x', 'spin1y', 'spin1z', 'spin2x',
-                'spin2y', 'spin2z', 'coa_phase', 'tc', 'ra', 'dec',
-                'polarization'
-            ],
-            detectors=['H1'],
-            delta_f=delta_f,
-            f_lower=f_lower,
-            approximant=tmplt_approx)
-    elif tmplt_approx in pywf.td_approximants():
-        generator = pywfg.TDomainDetFrameGenerator(
-            pywfg.TDomainCBCGenerator,
-            0,
-            variable_args=[
-                'mass1', 'mass2', 'spin1x', 'spin1y', 'spin1z', 'spin2x',
-                'spin2y', 'spin2z', 'coa_phase', 'tc', 'ra', 'dec',
-                'polarization'
-            ],
-            detectors=['H1'],
-            delta_t=delta_t,
-            f_lower=f_lower,
-            approximant=tmplt_approx)
+    if tmplt_approx in pywf.fd_approximants() or \
+            tmplt_approx in pywf.td_approximants():
+        generator = ctx.get_generator(tmplt_approx)
     elif 'FromDataFile' in tmplt_approx:
         if os.path.getsize(tmplt_file) == 0:
             raise RuntimeError(" ERROR:...OOPS. Waveform file %s empty!!" %
@@ -259,8 +396,7 @@ IN PROGRESS: Adding facility to use "FromDataFile" waveforms
             m1, m2, w_value, _ = _params
             waveform_params.mass1 = m1
             waveform_params.mass2 = m2
-            tmplt_h = make_frequency_series(tmplt_htilde)
-            tmplt_h = extend_waveform_FrequencySeries(tmplt_h, filter_n)
+            template_h = ctx.pad(tmplt_htilde, 'template')
         # except: raise IOError("Approximant %s not found.." % tmplt_approx)
     else:
         raise IOError("Template Approximant %s not found.." % tmplt_approx)
@@ -296,12 +432,9 @@ IN PROGRESS: Adding facility to use "FromDataFile" waveforms
             raise RuntimeError(rerr)
         # NOTE: SEOBNRv4 has extra high frequency content, it seems..
         if 'SEOBNRv4_ROM' in tmplt_approx or 'SEOBNRv2_ROM' in tmplt_approx:
-            template_h = extend_waveform_FrequencySeries(template['H1'],
-                                                         filter_n,
-                                                         force_fit=True)
+            template_h = ctx.pad(template['H1'], 'template', force_fit=True)
         else:
-            template_h = extend_waveform_FrequencySeries(
-                template['H1'], filter_n)
+            template_h = ctx.pad(template['H1'], 'template')
     elif tmplt_approx in pywf.td_approximants():
         try:
             template = generator.generate_from_args(_m1, _m2, _s1x, _s1y, _s1z,
@@ -315,15 +448,14 @@ IN PROGRESS: Adding facility to use "FromDataFile" waveforms
                   (tmplt_approx, _m1, _m2, _s1x, _s1y, _s1z, _s2x, _s2y, _s2z,
                    phic, tc, ra, dec, polarization))
             raise RuntimeError(rerr)
-        template_h = make_frequency_series(template['H1'])
-        template_h = extend_waveform_FrequencySeries(template_h, filter_n)
+        template_h = ctx.pad(template['H1'], 'template')
     elif 'FromDataFile' in tmplt_approx:
         pass
     else:
         raise IOError("Template Approximant %s not found.." % tmplt_approx)
 
     # 4) COMPUTE MATCH
-    m, idx = match(signal_h, template_h, psd=psd, low_frequency_cutoff=f_lower)
+    m, idx = ctx.match(signal_h, template_h)
 
     if debug:
         print("MATCH IS %.6f for parameters" % m, m1, m2, _s1x, _s1y, _s1z,
@@ -336,6 +468,228 @@ IN PROGRESS: Adding facility to use "FromDataFile" waveforms
 
 
 #############################
+def _fitting_factor_objective(x, ctx, signal_h, signal_norm, tmplt_generator,
+                              settings):
+    """
+    Objective minimized by the PSO in `calculate_fitting_factor`, i.e.
+    log10(1 - match) between the signal and the template at `x`.
+    `settings` holds the options fixed for the whole optimization.
+    """
+    # {{{
+    tmplt_approx = settings['tmplt_approx']
+    s1x, s1y, s1z, s2x, s2y, s2z = settings['signal_spins']
+    s_max = settings['s_max']
+    debug = settings['debug']
+    # 1) OBTAIN THE TEMPLATE PARAMETERS FROM X. ASSUME THAT ONLY
+    # THOSE ARE PASSED THAT ARE NEEDED BY THE GENERATOR
+    if len(x) == 2:
+        m1, m2 = x
+        if settings['vary_masses_only']:
+            _s1x = _s1y = _s1z = _s2x = _s2y = _s2z = 0
+        else:
+            _s1x, _s1y, _s1z = s1x, s1y, s1z
+            _s2x, _s2y, _s2z = s2x, s2y, s2z
+    elif len(x) == 4:
+        m1, m2, _s1z, _s2z = x
+        if settings['vary_masses_and_aligned_spin_only']:
+            _s1x = _s1y = _s2x = _s2y = 0
+        else:
+            _s1x, _s1y = s1x, s1y
+            _s2x, _s2y = s2x, s2y
+    elif len(x) == 8:
+        m1, m2, _s1x, _s1y, _s1z, _s2x, _s2y, _s2z = x
+    else:
+        raise IOError("No of vars %d not supported (should be 2 or 4 or 8)" %
+                      len(x))
+
+    # 2) CHECK FOR CONSISTENCY
+    if (_s1x**2 + _s1y**2 + _s1z**2) > s_max or (_s2x**2 + _s2y**2 +
+                                                 _s2z**2) > s_max:
+        return 1e99
+
+    # 2) ASSUME THAT
+    tmplt = tmplt_generator.generate_from_args(m1, m2, _s1x, _s1y, _s1z, _s2x,
+                                               _s2y, _s2z)
+    tmplt_h = tmplt['H1']
+
+    if debug:
+        print("IN FF Objective-> for parameters:", m1, m2, _s1x, _s1y, _s1z,
+              _s2x, _s2y, _s2z)
+    if debug:
+        print("IN FF Objective-> Length(tmplt) = %d, making it %d" %
+              (len(tmplt['H1']), ctx.filter_n))
+    # NOTE: SEOBNRv4 has extra high frequency content, it seems..
+    if 'SEOBNRv4_ROM' in tmplt_approx or 'SEOBNRv2_ROM' in tmplt_approx:
+        tmplt_h = ctx.pad(tmplt_h, 'ff_template', force_fit=True)
+    else:
+        tmplt_h = ctx.pad(tmplt_h, 'ff_template')
+
+    # 3) COMPUTE MATCH
+    m, _ = ctx.match(signal_h, tmplt_h, v1_norm=signal_norm)
+
+    if debug:
+        print("MATCH IS %.6f for parameters:" % m, m1, m2, _s1x, _s1y, _s1z,
+              _s2x, _s2y, _s2z)
+
+    retval = np.log10(1. - m)
+
+    # We do not want PSO to go berserk, so we stop when FF = 0.999999
+    if retval <= -6.0:
+        retval = -6.0
+    return retval
+    # }}}
+
+
+# Per-process state of fitting factor pool workers, set by the initializer
+_ff_worker = {}
+
+
+def _to_shared_array(arr):
+    """Copy a numpy array into shared memory usable by pool workers"""
+    arr = np.ascontiguousarray(arr)
+    buf = RawArray('b', arr.nbytes)
+    np.frombuffer(buf, dtype=arr.dtype)[:] = arr.ravel()
+    return buf, arr.dtype.str
+
+
+def _init_fitting_factor_worker(signal_buf, psd_buf, ctx_args, generator_args,
+                                settings):
+    """
+    Pool initializer. The signal and PSD are wrapped around the shared
+    buffers as-is, so every worker filters against the same memory.
+    """
+    # {{{
+    f_lower, sample_rate, signal_duration = ctx_args
+    delta_f = 1. / signal_duration
+    psd = FrequencySeries(np.frombuffer(psd_buf[0], dtype=psd_buf[1]),
+                          delta_f=delta_f,
+                          copy=False)
+    ctx = MatchContext(f_lower=f_lower,
+                       sample_rate=sample_rate,
+                       signal_duration=signal_duration,
+                       psd=psd)
+    signal_h = FrequencySeries(np.frombuffer(signal_buf[0],
+                                             dtype=signal_buf[1]),
+                               delta_f=delta_f,
+                               copy=False)
+    approximant, variable_args, static_args = generator_args
+    _ff_worker['ctx'] = ctx
+    _ff_worker['signal_h'] = signal_h
+    _ff_worker['signal_norm'] = ctx.sigmasq(signal_h)
+    _ff_worker['generator'] = ctx.get_generator(approximant, variable_args,
+                                                **static_args)
+    _ff_worker['settings'] = settings
+    # }}}
+
+
+def _fitting_factor_worker_objective(x):
+    """Evaluate the fitting factor objective inside a pool worker"""
+    return _fitting_factor_objective(x, _ff_worker['ctx'],
+                                     _ff_worker['signal_h'],
+                                     _ff_worker['signal_norm'],
+                                     _ff_worker['generator'],
+                                     _ff_worker['settings'])
+
+
+def pso_batched(func,
+                lb,
+                ub,
+                f_ieqcons=None,
+                args=(),
+                swarmsize=100,
+                omega=0.5,
+                phip=0.5,
+                phig=0.5,
+                maxiter=100,
+                minstep=1e-8,
+                minfunc=1e-8,
+                debug=False):
+    """
+Particle swarm optimization with the same interface and stopping rules
+as `pyswarm.pso`, except that `func(X, *args)` is handed the whole swarm
+as an array of shape (swarmsize, len(lb)) and must return one objective
+value per particle. This lets `func` farm a full iteration out to a
+process pool in one batch.
+
+Unlike `pyswarm.pso`, velocities within an iteration are all updated
+against the swarm best from the previous iteration.
+    """
+    # {{{
+    lb = np.array(lb, dtype=float)
+    ub = np.array(ub, dtype=float)
+    assert len(lb) == len(ub), 'Lower- and upper-bounds must be the same length'
+    assert np.all(ub > lb), 'All upper-bound values must be greater than lower-bound values'
+
+    vhigh = np.abs(ub - lb)
+    vlow = -vhigh
+
+    if f_ieqcons is None:
+
+        def is_feasible(x):
+            return True
+    else:
+
+        def is_feasible(x):
+            return np.all(np.array(f_ieqcons(x, *args)) >= 0)
+
+    S = swarmsize
+    D = len(lb)
+
+    # Initialize the particle swarm
+    x = lb + np.random.rand(S, D) * (ub - lb)
+    v = vlow + np.random.rand(S, D) * (vhigh - vlow)
+    p = x.copy()
+    fp = np.array(func(x, *args), dtype=float)
+    g = p[0, :].copy()
+    fg = 1e100
+    for i in range(S):
+        if fp[i] < fg and is_feasible(p[i, :]):
+            fg = fp[i]
+            g = p[i, :].copy()
+
+    # Iterate until termination criterion met
+    it = 1
+    while it <= maxiter:
+        rp = np.random.uniform(size=(S, D))
+        rg = np.random.uniform(size=(S, D))
+        v = omega * v + phip * rp * (p - x) + phig * rg * (g - x)
+        x = np.clip(x + v, lb, ub)
+        fx = np.array(func(x, *args), dtype=float)
+        for i in range(S):
+            if fx[i] < fp[i] and is_feasible(x[i, :]):
+                p[i, :] = x[i, :].copy()
+                fp[i] = fx[i]
+                if fx[i] < fg:
+                    if debug:
+                        print('New best for swarm at iteration {:}: {:} {:}'.
+                              format(it, x[i, :], fx[i]))
+                    tmp = x[i, :].copy()
+                    stepsize = np.sqrt(np.sum((g - tmp)**2))
+                    if np.abs(fg - fx[i]) <= minfunc:
+                        print(
+                            'Stopping search: Swarm best objective change less than {:}'
+                            .format(minfunc))
+                        return tmp, fx[i]
+                    elif stepsize <= minstep:
+                        print(
+                            'Stopping search: Swarm best position change less than {:}'
+                            .format(minstep))
+                        return tmp, fx[i]
+                    else:
+                        g = tmp.copy()
+                        fg = fx[i]
+        if debug:
+            print('Best after iteration {:}: {:} {:}'.format(it, g, fg))
+        it += 1
+
+    print('Stopping search: maximum iterations reached --> {:}'.format(maxiter))
+    if not is_feasible(g):
+        print("However, the optimization couldn't find a feasible design. Sorry")
+    return g, fg
+    # }}}
+
+
+
 def calculate_fitting_factor(m1,
                              m2,
                              s1x=0,
@@ -366,8 +720,10 @@ def calculate_fitting_factor(m1,
                              pso_phip=0.5,
                              pso_phig=0.25,
                              pso_minfunc=1e-8,
+                             pso_processes=1,
                              verbose=True,
-                             debug=False):
+                             debug=False,
+                             match_context=None):
     """
 Calculates the fitting factor for a signal of given physical
 parameters, as modelled by a given signal approximant, against
@@ -378,6 +734,14 @@ the overlaps between signal and templates. Algorithm parameters
 are tunable, depending on how many dimensions we are optimizing
 over.
 
+If a `MatchContext` is passed as `match_context`, its PSD, generators
+and buffers are reused, and `f_lower`, `sample_rate`, `signal_duration`
+and `psd_string` are ignored in favor of the context's settings.
+
+With `pso_processes` > 1, each PSO iteration evaluates the whole swarm
+in one batch on a pool of that many processes (see `pso_batched`). The
+signal and PSD are placed in shared memory for the workers.
+
 IN PROGRESS: Adding facility to use "FromDataFile" waveforms
     """
     # {{{
@@ -400,48 +764,30 @@ IN PROGRESS: Adding facility to use "FromDataFile" waveforms
         )
 
     # 1) GENERATE FILTERING META-PARAMETERS
-    signal_duration = int(signal_duration)
-    sample_rate = int(sample_rate)
-    filter_N = signal_duration * sample_rate
-    filter_n = filter_N / 2 + 1
-    delta_t = 1. / sample_rate
-    delta_f = 1. / signal_duration
+    if match_context is None:
+        match_context = MatchContext(f_lower=f_lower,
+                                     sample_rate=sample_rate,
+                                     signal_duration=signal_duration,
+                                     psd_string=psd_string)
+    ctx = match_context
+    f_lower = ctx.f_lower
+    sample_rate = ctx.sample_rate
+    signal_duration = ctx.signal_duration
+    filter_N = ctx.filter_N
+    filter_n = ctx.filter_n
+    delta_t = ctx.delta_t
+    delta_f = ctx.delta_f
     if verbose:
         print(
             "signal_duration = %d, sample_rate = %d, filter_N = %d, filter_n = %d"
             % (signal_duration, sample_rate, filter_N, filter_n))
         print("deltaT = %f, deltaF = %f" % (delta_t, delta_f))
-    # LIGO Noise PSD
-    psd = from_string(psd_string, filter_n, delta_f, f_lower)
 
     # 2) GENERATE THE TARGET SIGNAL
     # PREPARATORY: Get the signal generator
-    if signal_approx in pywf.fd_approximants():
-        generator = pywfg.FDomainDetFrameGenerator(
-            pywfg.FDomainCBCGenerator,
-            0,
-            variable_args=[
-                'mass1', 'mass2', 'spin1x', 'spin1y', 'spin1z', 'spin2x',
-                'spin2y', 'spin2z', 'coa_phase', 'tc', 'ra', 'dec',
-                'polarization'
-            ],
-            detectors=['H1'],
-            delta_f=delta_f,
-            f_lower=f_lower,
-            approximant=signal_approx)
-    elif signal_approx in pywf.td_approximants():
-        generator = pywfg.TDomainDetFrameGenerator(
-            pywfg.TDomainCBCGenerator,
-            0,
-            variable_args=[
-                'mass1', 'mass2', 'spin1x', 'spin1y', 'spin1z', 'spin2x',
-                'spin2y', 'spin2z', 'coa_phase', 'tc', 'ra', 'dec',
-                'polarization'
-            ],
-            detectors=['H1'],
-            delta_t=delta_t,
-            f_lower=f_lower,
-            approximant=signal_approx)
+    if signal_approx in pywf.fd_approximants() or \
+            signal_approx in pywf.td_approximants():
+        generator = ctx.get_generator(signal_approx)
     elif 'FromDataFile' in signal_approx:
         if os.path.getsize(signal_file) == 0:
             raise RuntimeError(" ERROR:...OOPS. Waveform file %s empty!!" %
@@ -479,8 +825,7 @@ IN PROGRESS: Adding facility to use "FromDataFile" waveforms
             m1, m2, w_value, _ = _params
             waveform_params.mass1 = m1
             waveform_params.mass2 = m2
-            signal_h = make_frequency_series(signal_htilde)
-            signal_h = extend_waveform_FrequencySeries(signal_h, filter_n)
+            signal_h = ctx.pad(signal_htilde, 'ff_signal')
         # except: raise IOError("Approximant %s not found.." % signal_approx)
     else:
         raise IOError("Approximant %s not found.." % signal_approx)
@@ -496,13 +841,12 @@ IN PROGRESS: Adding facility to use "FromDataFile" waveforms
         signal = generator.generate_from_args(m1, m2, s1x, s1y, s1z, s2x, s2y,
                                               s2z, phic, tc, ra, dec,
                                               polarization)
-        signal_h = extend_waveform_FrequencySeries(signal['H1'], filter_n)
+        signal_h = ctx.pad(signal['H1'], 'ff_signal')
     elif signal_approx in pywf.td_approximants():
         signal = generator.generate_from_args(m1, m2, s1x, s1y, s1z, s2x, s2y,
                                               s2z, phic, tc, ra, dec,
                                               polarization)
-        signal_h = make_frequency_series(signal['H1'])
-        signal_h = extend_waveform_FrequencySeries(signal_h, filter_n)
+        signal_h = ctx.pad(signal['H1'], 'ff_signal')
     elif 'FromDataFile' in signal_approx:
         pass
     else:
@@ -517,43 +861,19 @@ IN PROGRESS: Adding facility to use "FromDataFile" waveforms
     # values, in case only masses or only mass+aligned-spin components are
     # requested to be varied. This fixing is done inside the objective
     # function.
+    tmplt_variable_args = DETECTOR_FRAME_VARIABLE_ARGS[:8]
+    tmplt_static_args = dict(coa_phase=phic,
+                             tc=tc,
+                             ra=ra,
+                             dec=dec,
+                             polarization=polarization)
     if tmplt_approx in pywf.fd_approximants():
-        generator_tmplt = pywfg.FDomainDetFrameGenerator(
-            pywfg.FDomainCBCGenerator,
-            0,
-            variable_args=[
-                'mass1', 'mass2', 'spin1x', 'spin1y', 'spin1z', 'spin2x',
-                'spin2y', 'spin2z'
-            ],
-            detectors=['H1'],
-            coa_phase=phic,
-            tc=tc,
-            ra=ra,
-            dec=dec,
-            polarization=polarization,
-            delta_f=delta_f,
-            f_lower=f_lower,
-            approximant=tmplt_approx)
+        generator_tmplt = ctx.get_generator(tmplt_approx, tmplt_variable_args,
+                                            **tmplt_static_args)
     elif tmplt_approx in pywf.td_approximants():
         raise IOError(
             "Time-domain templates not supported yet (TDomainDetFrameGenerator doesn't exist)"
         )
-        generator_tmplt = pywfg.TDomainDetFrameGenerator(
-            pywfg.TDomainCBCGenerator,
-            0,
-            variable_args=[
-                'mass1', 'mass2', 'spin1x', 'spin1y', 'spin1z', 'spin2x',
-                'spin2y', 'spin2z'
-            ],
-            detectors=['H1'],
-            coa_phase=phic,
-            tc=tc,
-            ra=ra,
-            dec=dec,
-            polarization=polarization,
-            delta_t=delta_t,
-            f_lower=f_lower,
-            approximant=tmplt_approx)
     elif 'FromDataFile' in tmplt_approx:
         raise RuntimeError(
             "Using **templates** from data files is not implemented yet")
@@ -566,66 +886,9 @@ IN PROGRESS: Adding facility to use "FromDataFile" waveforms
         This function is to be minimized if the fitting factor is to be found
         """
         objective_function_fitting_factor.counter += 1
-        # 1) OBTAIN THE TEMPLATE PARAMETERS FROM X. ASSUME THAT ONLY
-        # THOSE ARE PASSED THAT ARE NEEDED BY THE GENERATOR
-        if len(x) == 2:
-            m1, m2 = x
-            if vary_masses_only:
-                _s1x = _s1y = _s1z = _s2x = _s2y = _s2z = 0
-            else:
-                _s1x, _s1y, _s1z = s1x, s1y, s1z
-                _s2x, _s2y, _s2z = s2x, s2y, s2z
-        elif len(x) == 4:
-            m1, m2, _s1z, _s2z = x
-            if vary_masses_and_aligned_spin_only:
-                _s1x = _s1y = _s2x = _s2y = 0
-            else:
-                _s1x, _s1y = s1x, s1y
-                _s2x, _s2y = s2x, s2y
-        elif len(x) == 8:
-            m1, m2, _s1x, _s1y, _s1z, _s2x, _s2y, _s2z = x
-        else:
-            raise IOError(
-                "No of vars %d not supported (should be 2 or 4 or 8)" % len(x))
-
-        # 2) CHECK FOR CONSISTENCY
-        if (_s1x**2 + _s1y**2 + _s1z**2) > s_max or (_s2x**2 + _s2y**2 +
-                                                     _s2z**2) > s_max:
-            return 1e99
-
-        # 2) ASSUME THAT
-        signal_h, tmplt_generator = args
-        tmplt = tmplt_generator.generate_from_args(m1, m2, _s1x, _s1y, _s1z,
-                                                   _s2x, _s2y, _s2z)
-        tmplt_h = make_frequency_series(tmplt['H1'])
-
-        if debug:
-            print("IN FF Objective-> for parameters:", m1, m2, _s1x, _s1y,
-                  _s1z, _s2x, _s2y, _s2z)
-        if debug:
-            print("IN FF Objective-> Length(tmplt) = %d, making it %d" %
-                  (len(tmplt['H1']), filter_n))
-        # NOTE: SEOBNRv4 has extra high frequency content, it seems..
-        if 'SEOBNRv4_ROM' in tmplt_approx or 'SEOBNRv2_ROM' in tmplt_approx:
-            tmplt_h = extend_waveform_FrequencySeries(tmplt_h,
-                                                      filter_n,
-                                                      force_fit=True)
-        else:
-            tmplt_h = extend_waveform_FrequencySeries(tmplt_h, filter_n)
-
-        # 3) COMPUTE MATCH
-        m, _ = match(signal_h, tmplt_h, psd=psd, low_frequency_cutoff=f_lower)
-
-        if debug:
-            print("MATCH IS %.6f for parameters:" % m, m1, m2, _s1x, _s1y,
-                  _s1z, _s2x, _s2y, _s2z)
-
-        retval = np.log10(1. - m)
-
-        # We do not want PSO to go berserk, so we stop when FF = 0.999999
-        if retval <= -6.0:
-            retval = -6.0
-        return retval
+        signal_h, tmplt_generator, signal_norm = args
+        return _fitting_factor_objective(x, ctx, signal_h, signal_norm,
+                                         tmplt_generator, objective_settings)
 
     objective_function_fitting_factor.counter = 0
 
@@ -661,7 +924,8 @@ IN PROGRESS: Adding facility to use "FromDataFile" waveforms
 
     # 6) FINALLY, CALL THE PSO TO COMPUTE THE FITTING FACTOR
     # 6a) FIRST CONSTRUCT THE FIXED ARGUMENTS FOR THE PSO's OBJECTIVE FUNCTION
-    pso_args = (signal_h, generator_tmplt)
+    # The signal is fixed, so its norm is computed only once here
+    pso_args = (signal_h, generator_tmplt, ctx.sigmasq(signal_h))
 
     # 6b) NOW SET THE RANGE OF PARAMETERS TO BE PROBED
     mt = m1 + m2 * 1.0
@@ -680,6 +944,15 @@ IN PROGRESS: Adding facility to use "FromDataFile" waveforms
     s_eff = (s1z * m1 + s2z * m2) / (m1 + m2)
     s_eff_min = s_eff - effective_spin_window
     s_eff_max = s_eff + effective_spin_window
+    objective_settings = {
+        'tmplt_approx': tmplt_approx,
+        'signal_spins': (s1x, s1y, s1z, s2x, s2y, s2z),
+        'vary_masses_only': vary_masses_only,
+        'vary_masses_and_aligned_spin_only':
+        vary_masses_and_aligned_spin_only,
+        's_max': s_max,
+        'debug': debug
+    }
 
     if verbose:
         print(m1, m2, mt, et, mc, mc_min, mc_max, et_min, et_max, m1_min,
@@ -719,11 +992,9 @@ IN PROGRESS: Adding facility to use "FromDataFile" waveforms
         tmplt_file=None,
         aligned_spin_tmplt_only=vary_masses_and_aligned_spin_only,
         non_spin_tmplt_only=vary_masses_only,
-        f_lower=f_lower,
-        sample_rate=sample_rate,
-        signal_duration=signal_duration,
         verbose=verbose,
-        debug=debug)
+        debug=debug,
+        match_context=ctx)
     #
     if verbose:
         print("Overlap with aligned_spin_tmplt_only = ",
@@ -731,41 +1002,84 @@ IN PROGRESS: Adding facility to use "FromDataFile" waveforms
               vary_masses_only, ": ", olap, np.log10(1. - olap))
         sys.stdout.flush()
     #
-    idx = 1
-    ff = 0.0
-    while ff < olap:
-        if idx and idx % 2 == 0:
-            pso_minfunc *= 0.1
-            pso_phig *= 1.1
-
-        if idx > num_retries:
-            print(
-                "WARNING: Failed to improve on overlap in %d iterations. Set ff = olap now"
-                % num_retries)
-            ff = olap
-            break
-
-        if verbose:
-            print("\nTry %d to compute fitting factor" % idx)
-            sys.stdout.flush()
-        params, ff = pso(objective_function_fitting_factor,
-                         low_lim,
-                         high_lim,
-                         f_ieqcons=constraint_function_fitting_factor,
-                         args=pso_args,
-                         swarmsize=pso_swarm_size,
-                         omega=pso_omega,
-                         phip=pso_phip,
-                         phig=pso_phig,
-                         minfunc=pso_minfunc,
-                         maxiter=500,
-                         debug=verbose)
-        # Restore fitting factor from 1-ff
-        ff = 1.0 - 10**ff
-        if verbose:
-            print("\nLoop will continue till %.12f < %.12f" % (ff, olap))
-            sys.stdout.flush()
-        idx += 1
+    # 6c) IN BATCHED MODE, START THE WORKERS THAT EVALUATE THE SWARM
+    pool = None
+    if pso_processes > 1:
+        pool = Pool(processes=pso_processes,
+                    initializer=_init_fitting_factor_worker,
+                    initargs=(_to_shared_array(signal_h.numpy()),
+                              _to_shared_array(ctx.psd.numpy()),
+                              (ctx.f_lower, ctx.sample_rate,
+                               ctx.signal_duration),
+                              (tmplt_approx, tmplt_variable_args,
+                               tmplt_static_args), objective_settings))
+
+        def evaluate_swarm(X, *args):
+            objective_function_fitting_factor.counter += len(X)
+            return pool.map(_fitting_factor_worker_objective,
+                            list(X),
+                            chunksize=max(1, len(X) // (4 * pso_processes)))
+
+    #
+    # Stop the workers on the way out, also when the optimization fails
+    try:
+        idx = 1
+        ff = 0.0
+        while ff < olap:
+            if idx and idx % 2 == 0:
+                pso_minfunc *= 0.1
+                pso_phig *= 1.1
+
+            if idx > num_retries:
+                print(
+                    "WARNING: Failed to improve on overlap in %d iterations. Set ff = olap now"
+                    % num_retries)
+                ff = olap
+                break
+
+            if verbose:
+                print("\nTry %d to compute fitting factor" % idx)
+                sys.stdout.flush()
+            if pool is None:
+                params, ff = pso(objective_function_fitting_factor,
+                                 low_lim,
+                                 high_lim,
+                                 f_ieqcons=constraint_function_fitting_factor,
+                                 args=pso_args,
+                                 swarmsize=pso_swarm_size,
+                                 omega=pso_omega,
+                                 phip=pso_phip,
+                                 phig=pso_phig,
+                                 minfunc=pso_minfunc,
+                                 maxiter=500,
+                                 debug=verbose)
+            else:
+                params, ff = pso_batched(
+                    evaluate_swarm,
+                    low_lim,
+                    high_lim,
+                    f_ieqcons=constraint_function_fitting_factor,
+                    swarmsize=pso_swarm_size,
+                    omega=pso_omega,
+                    phip=pso_phip,
+                    phig=pso_phig,
+                    minfunc=pso_minfunc,
+                    maxiter=500,
+                    debug=verbose)
+            # Restore fitting factor from 1-ff
+            ff = 1.0 - 10**ff
+            if verbose:
+                print("\nLoop will continue till %.12f < %.12f" % (ff, olap))
+                sys.stdout.flush()
+            idx += 1
+    except BaseException:
+        if pool is not None:
+            pool.terminate()
+        raise
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
 
     if verbose:
         print("optimization took %d objective func evals" %
@@ -777,6 +1091,194 @@ IN PROGRESS: Adding facility to use "FromDataFile" waveforms
     # }}}
 
 
+######################################################################
+#      Batched matches
+
+
+class BatchedMatch(object):
+    """
+Matches of one signal against a block of templates (or of a block of
+signals against a block of templates, row by row) with a single
+multi-row inverse FFT.
+
+Waveforms are first turned into whitened, unit-norm spectra over the
+frequency indices [kmin, kmax) with `whiten`, i.e.
+
+    a_k = h_k * sqrt(4 delta_f / S_k) / sigma(h)
+
+so that the match between two such spectra a, b is
+
+    max_t | sum_k conj(a_k) b_k exp(2 pi i k t / N) |
+
+which is what `pycbc.filter.match` computes.
+
+Parameters
+----------
+psd: FrequencySeries
+    The PSD to whiten with. Its length sets the FFT length N.
+low_frequency_cutoff, high_frequency_cutoff: float
+    Frequency range of the filter.
+workers: int
+    Threads used by the inverse FFT. Requires scipy.fft, ignored
+    otherwise.
+chunk_size: int
+    Maximum number of rows inverse Fourier transformed together. Each row
+    needs N complex samples of scratch space.
+    """
+    def __init__(self,
+                 psd,
+                 low_frequency_cutoff=None,
+                 high_frequency_cutoff=None,
+                 workers=1,
+                 chunk_size=16):
+        # {{{
+        self.N = (len(psd) - 1) * 2
+        self.delta_f = psd.delta_f
+        self.kmin, self.kmax = get_cutoff_indices(low_frequency_cutoff,
+                                                  high_frequency_cutoff,
+                                                  self.delta_f, self.N)
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self._weight = np.sqrt(
+            4. * self.delta_f /
+            np.asarray(psd.numpy()[self.kmin:self.kmax], dtype=np.float64))
+        # }}}
+
+    @property
+    def length(self):
+        """Length of whitened spectra"""
+        return self.kmax - self.kmin
+
+    def whiten(self, vec, sigma=None):
+        """
+        Return the whitened, unit-norm spectrum of the FrequencySeries
+        `vec`, and its sigma. Pass `sigma` if it is already known.
+        A spectrum with no power in the filter's frequency range has
+        sigma 0, and is returned as zeros.
+        """
+        w = np.asarray(vec.numpy()[self.kmin:self.kmax],
+                       dtype=np.complex128) * self._weight
+        if sigma is None:
+            sigma = np.sqrt(np.vdot(w, w).real)
+        if not sigma > 0:
+            return np.zeros_like(w), 0.
+        return w / sigma, sigma
+
+    def match(self, templates, signal):
+        """
+        Maximized matches between the rows of `templates` and `signal`,
+        both whitened with `whiten`. `signal` is either one spectrum,
+        matched against every row of `templates`, or a 2-D array with as
+        many rows as `templates`, matched row by row.
+
+        Returns the array of matches, and the array of sample indices at
+        which each one peaks.
+        """
+        # {{{
+        templates = np.atleast_2d(templates)
+        signal = np.asarray(signal)
+        M = len(templates)
+        matches = np.zeros(M)
+        indices = np.zeros(M, dtype=int)
+        if M == 0:
+            return matches, indices
+        buf = np.zeros((min(self.chunk_size, M), self.N), dtype=np.complex128)
+        fft_kwargs = {'workers': self.workers} if _FFT_HAS_WORKERS else {}
+        for start in range(0, M, self.chunk_size):
+            stop = min(start + self.chunk_size, M)
+            rows = stop - start
+            sig = signal if signal.ndim == 1 else signal[start:stop]
+            buf[:rows, self.kmin:self.kmax] = np.conj(
+                templates[start:stop]) * sig
+            absq = np.abs(_fft.ifft(buf[:rows], axis=1, **fft_kwargs))
+            peaks = absq.argmax(axis=1)
+            # numpy / scipy normalize the inverse FFT by 1/N, pycbc does not
+            matches[start:stop] = absq[np.arange(rows), peaks] * self.N
+            indices[start:stop] = peaks
+        return matches, indices
+        # }}}
+
+    def match_and_overlap(self, vec1, vec2):
+        """
+        Maximized match, unmaximized overlap, the sample index at which the
+        match peaks and the sigmas of the FrequencySeries `vec1` and `vec2`,
+        i.e. what `pycbc.filter.match`, `overlap` and `sigma` return, from
+        a single weighted correlation and one inverse FFT.
+        """
+        # {{{
+        w1, sigma1 = self.whiten(vec1)
+        w2, sigma2 = self.whiten(vec2)
+        buf = np.zeros(self.N, dtype=np.complex128)
+        buf[self.kmin:self.kmax] = np.conj(w1) * w2
+        fft_kwargs = {'workers': self.workers} if _FFT_HAS_WORKERS else {}
+        absq = np.abs(_fft.ifft(buf, **fft_kwargs))
+        peak = absq.argmax()
+        # the overlap is the correlation at zero lag
+        overlap = buf[self.kmin:self.kmax].sum().real
+        return absq[peak] * self.N, overlap, peak, sigma1, sigma2
+        # }}}
+
+
+class TemplateBlock(object):
+    """
+Whitened spectra of a fixed-size block of templates, filled in row by
+row as the templates become available, to be matched against signals
+with one `BatchedMatch.match` call per signal.
+
+With `shared`, the rows are kept in shared memory. Passing the block's
+`buffers` to pool workers (e.g. through the pool initializer) lets them
+build blocks over the very same rows, so that rows set in one process are
+seen by all others without copying.
+    """
+    def __init__(self, kernel, size, shared=False, buffers=None):
+        # {{{
+        self.kernel = kernel
+        if buffers is None and shared:
+            buffers = (RawArray('b', size * kernel.length *
+                                np.dtype(np.complex128).itemsize),
+                       RawArray('b', size * np.dtype(np.float64).itemsize),
+                       RawArray('b', size))
+        self.buffers = buffers
+        if buffers is not None:
+            spectra_buf, sigmas_buf, filled_buf = buffers
+            self.spectra = np.frombuffer(spectra_buf,
+                                         dtype=np.complex128).reshape(
+                                             size, kernel.length)
+            self.sigmas = np.frombuffer(sigmas_buf, dtype=np.float64)
+            self.filled = np.frombuffer(filled_buf, dtype=bool)
+        else:
+            self.spectra = np.zeros((size, kernel.length),
+                                    dtype=np.complex128)
+            self.sigmas = np.zeros(size)
+            self.filled = np.zeros(size, dtype=bool)
+        # }}}
+
+    def __len__(self):
+        return len(self.spectra)
+
+    def reset(self):
+        """Mark all rows as empty, to reuse the block for new templates"""
+        self.sigmas[:] = 0
+        self.filled[:] = False
+
+    def set(self, i, vec, sigma=None):
+        """Whiten template `vec` into row `i`. Rows of templates with
+        sigma 0 are left unfilled."""
+        self.spectra[i], self.sigmas[i] = self.kernel.whiten(vec, sigma=sigma)
+        self.filled[i] = self.sigmas[i] > 0
+
+    def match(self, signal, rows=None, signal_sigma=None):
+        """
+        Maximized matches of the FrequencySeries `signal` against the
+        templates in `rows` (default: all). Returns matches and peak
+        indices, in the order of `rows`.
+        """
+        if rows is None:
+            rows = np.arange(len(self))
+        sig, _ = self.kernel.whiten(signal, sigma=signal_sigma)
+        return self.kernel.match(self.spectra[rows], sig)
+
+
 ######################################################################
 ######################################################################
 #
@@ -786,6 +1288,71 @@ IN PROGRESS: Adding facility to use "FromDataFile" waveforms
 ######################################################################
 
 
+#############################
+def get_detector_waveform(wav, approximant, f_min, dt, N,
+                          tolerate_failures=False):
+    """
+    Frequency-domain detector strain of the point `wav` (a SimInspiral row or
+    a record with the same columns), zero-padded to a time-domain length N
+    at sample spacing dt. Frequency-domain approximants are generated up to
+    Mf = 0.15, or the Nyquist frequency if lower.
+
+    If waveform generation fails, returns None when `tolerate_failures` is
+    set, and raises RuntimeError otherwise.
+    """
+    # {{{
+    from gwnr.waveform.utils import generate_detector_strain
+    m1 = wav.mass1
+    m2 = wav.mass2
+    params = dict(mass1=m1, mass2=m2,
+                  spin1x=wav.spin1x, spin1y=wav.spin1y, spin1z=wav.spin1z,
+                  spin2x=wav.spin2x, spin2y=wav.spin2y, spin2z=wav.spin2z,
+                  eccentricity=wav.alpha,
+                  mean_per_ano=wav.alpha1,
+                  long_asc_nodes=wav.alpha2,
+                  coa_phase=wav.coa_phase,
+                  inclination=wav.inclination, distance=wav.distance,
+                  f_lower=f_min)
+
+    df = 1. / (dt * N)
+    # choose a sensible max frequency: put a threshold at Mf = 0.15
+    f_max = min(1. / (2. * dt), 0.15 / ((m1 + m2) * lal.MTSUN_SI))
+
+    if approximant in pywf.fd_approximants():
+        try:
+            hptild, hctild = pywf.get_fd_waveform(approximant=approximant,
+                                                  f_final=f_max, delta_f=df,
+                                                  **params)
+        except RuntimeError as re:
+            logging.info("Waveform generation failed for {}".format(wav))
+            if tolerate_failures:
+                return None
+            raise RuntimeError(re)
+        hp = FrequencySeries(zeros(N // 2 + 1), delta_f=df,
+                             dtype=np.complex128, copy=True)
+        hp[0:len(hptild)] = hptild
+        hc = FrequencySeries(zeros(N // 2 + 1), delta_f=df,
+                             dtype=np.complex128, copy=True)
+        hc[0:len(hctild)] = hctild
+        return generate_detector_strain(wav, hp, hc)
+    elif approximant in pywf.td_approximants():
+        try:
+            hptd, hctd = pywf.get_td_waveform(approximant=approximant,
+                                              delta_t=dt, **params)
+        except RuntimeError as re:
+            logging.info("Waveform generation failed for {}".format(wav))
+            if tolerate_failures:
+                return None
+            raise RuntimeError(re)
+        hp = TimeSeries(zeros(N), delta_t=dt, dtype=hptd.dtype, copy=True)
+        hp[:len(hptd)] = hptd
+        hc = TimeSeries(zeros(N), delta_t=dt, dtype=hctd.dtype, copy=True)
+        hc[:len(hctd)] = hctd
+        return make_frequency_series(generate_detector_strain(wav, hp, hc))
+    raise IOError("Approximant {} not supported".format(approximant))
+    # }}}
+
+
 #############################
 def overlap_between_waveforms(wav1, wav2, psd=None, f_lower=15.):
     '''
@@ -22,10 +22,33 @@
 #
 """Utilities for various actions on PSD measured from data"""
 
+import os
+import glob
+import hashlib
+import tempfile
+import time
 import numpy
 import scipy
+import pycbc.psd
+from pycbc.psd import from_string
 from pycbc.types import FrequencySeries
 
+# Environment variables that point the PSD cache to a directory, and set
+# its budget in MB
+PSD_CACHE_DIR_ENV = 'GWNR_PSD_CACHE_DIR'
+PSD_CACHE_MB_ENV = 'GWNR_PSD_CACHE_MB'
+
+# Age in seconds after which temporary files in the PSD cache are taken to
+# be left behind by killed jobs
+PSD_CACHE_STALE_TMP_AGE = 3600.
+
+
+def _umask():
+    """The umask of this process, which can only be read by setting it"""
+    mask = os.umask(0)
+    os.umask(mask)
+    return mask
+
 
 def resample_and_extrapolate_psd(
         freq_vals,
@@ -78,3 +101,207 @@ def resample_and_extrapolate_psd(
     data_f_max_mask = (interpolated_freq_vals > data_f_max)
     interpolated_psd.data[data_f_max_mask] = psd_vals[-1]
     return interpolated_psd
+
+
+class PSDCache(object):
+    """
+On-disk cache of PSDs, stored as .npy files named by a hash of the PSD's
+key, e.g. (name or file hash, length, delta_f, f_lower, precision).
+Cached PSDs are memory-mapped copy-on-write, so that all processes on a
+node that read the same PSD share its pages.
+
+Files are written under a temporary name and moved in place, so that
+concurrent jobs never read a partial file. Once the files in the
+directory exceed `max_bytes`, the least recently used ones are removed.
+A `max_bytes` of 0 means unlimited. Files are made readable by all users
+allowed by the umask, so that jobs of other users on the node can share
+them. Temporary files left behind by killed jobs are removed on eviction.
+    """
+    def __init__(self, cache_dir, max_bytes=0):
+        # {{{
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        if not os.path.isdir(cache_dir):
+            try:
+                os.makedirs(cache_dir)
+            except OSError:
+                # another job may have created it in the meantime
+                if not os.path.isdir(cache_dir):
+                    raise
+        # }}}
+
+    def path(self, key):
+        """Name of the file that holds the PSD with `key`"""
+        digest = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, 'psd_' + digest + '.npy')
+
+    def get(self, key, delta_f, generate):
+        """
+        Return the PSD with `key` as a FrequencySeries, calling `generate`
+        (which takes no arguments) and storing its result on a miss.
+        """
+        # {{{
+        file_name = self.path(key)
+        try:
+            data = numpy.load(file_name, mmap_mode='c')
+            # mark as recently used
+            os.utime(file_name, None)
+            return FrequencySeries(data, delta_f=delta_f, copy=False)
+        except (IOError, OSError, ValueError):
+            pass
+        psd = generate()
+        self.store(file_name, psd.numpy())
+        return psd
+        # }}}
+
+    def store(self, file_name, data):
+        """Write `data` to `file_name` atomically, then evict"""
+        # {{{
+        fd, tmp_name = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as fout:
+                numpy.save(fout, data)
+            # mkstemp creates the file readable by its owner only
+            os.chmod(tmp_name, 0o644 & ~_umask())
+            os.rename(tmp_name, file_name)
+        except (IOError, OSError):
+            if os.path.exists(tmp_name):
+                os.remove(tmp_name)
+            return
+        self.evict(keep=file_name)
+        # }}}
+
+    def evict(self, keep=None):
+        """Remove stale temporary files, and the least recently used files
+        beyond the budget, except `keep`"""
+        # {{{
+        now = time.time()
+        for tmp_name in glob.glob(os.path.join(self.cache_dir, '*.tmp')):
+            try:
+                if now - os.stat(tmp_name).st_mtime > PSD_CACHE_STALE_TMP_AGE:
+                    os.remove(tmp_name)
+            except OSError:
+                # being renamed or removed by another job
+                pass
+        if not self.max_bytes:
+            return
+        entries = []
+        for file_name in glob.glob(os.path.join(self.cache_dir, 'psd_*.npy')):
+            try:
+                st = os.stat(file_name)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, file_name))
+        total = sum(e[1] for e in entries)
+        for _, size, file_name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if file_name == keep:
+                continue
+            try:
+                os.remove(file_name)
+            except OSError:
+                # already removed by another job
+                pass
+            total -= size
+        # }}}
+
+
+def get_psd_cache(cache_dir=None, max_mb=None):
+    """
+    The PSD cache in `cache_dir`, with a budget of `max_mb` MB. They default
+    to the environment variables GWNR_PSD_CACHE_DIR and GWNR_PSD_CACHE_MB
+    (1024 MB if not set). Returns None, i.e. no caching, if no directory is
+    given either way.
+    """
+    if cache_dir is None:
+        cache_dir = os.environ.get(PSD_CACHE_DIR_ENV)
+    if not cache_dir:
+        return None
+    if max_mb is None:
+        max_mb = float(os.environ.get(PSD_CACHE_MB_ENV, 1024))
+    return PSDCache(cache_dir, max_bytes=int(max_mb * 1024**2))
+
+
+def _file_hash(file_name):
+    """SHA1 digest of the contents of `file_name`"""
+    digest = hashlib.sha1()
+    with open(file_name, 'rb') as fin:
+        for chunk in iter(lambda: fin.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _float_key(x):
+    return None if x is None else '%.17g' % x
+
+
+def cached_psd_from_string(psd_name,
+                           length,
+                           delta_f,
+                           low_frequency_cutoff,
+                           precision=None,
+                           cache_dir=None,
+                           max_mb=None):
+    """
+    `pycbc.psd.from_string`, through the PSD cache of `get_psd_cache`.
+    `precision` ('single' or 'double') sets the dtype of the returned PSD.
+    """
+    # {{{
+    def generate():
+        psd = from_string(psd_name, length, delta_f, low_frequency_cutoff)
+        if precision == 'single':
+            psd = psd.astype(numpy.float32)
+        return psd
+
+    cache = get_psd_cache(cache_dir, max_mb)
+    if cache is None:
+        return generate()
+    key = ('from_string', psd_name, int(length), _float_key(delta_f),
+           _float_key(low_frequency_cutoff), precision)
+    return cache.get(key, delta_f, generate)
+    # }}}
+
+
+def cached_psd_from_cli(opt,
+                        length,
+                        delta_f,
+                        low_frequency_cutoff,
+                        strain=None,
+                        dyn_range_factor=1,
+                        precision=None,
+                        cache_dir=None,
+                        max_mb=None):
+    """
+    `pycbc.psd.from_cli`, through the PSD cache of `get_psd_cache`. PSDs
+    read from files are keyed by a hash of the file contents. PSDs
+    estimated from data are never cached.
+    """
+    # {{{
+    def generate():
+        return pycbc.psd.from_cli(opt, length, delta_f, low_frequency_cutoff,
+                                  strain=strain,
+                                  dyn_range_factor=dyn_range_factor,
+                                  precision=precision)
+
+    cache = get_psd_cache(cache_dir, max_mb)
+    if cache is None or getattr(opt, 'psd_estimation', None):
+        return generate()
+    if getattr(opt, 'psd_model', None):
+        source = ('model', opt.psd_model)
+    elif getattr(opt, 'psd_file', None):
+        source = ('psd_file', _file_hash(opt.psd_file))
+    elif getattr(opt, 'asd_file', None):
+        source = ('asd_file', _file_hash(opt.asd_file))
+    else:
+        return generate()
+    extra = tuple(
+        getattr(opt, name, None) for name in [
+            'psd_inverse_length', 'invpsd_trunc_method',
+            'psd_file_xml_ifo_string', 'psd_file_xml_root_name'
+        ])
+    key = ('from_cli', source, int(length), _float_key(delta_f),
+           _float_key(low_frequency_cutoff), precision,
+           _float_key(dyn_range_factor)) + extra
+    return cache.get(key, delta_f, generate)
+    # }}}
@@ -20,6 +20,7 @@
 #
 # =============================================================================
 #
+import bisect
 import pycbc.pnutils as pnutils
 import numpy as np
 
@@ -74,3 +75,218 @@ def outside_tau0_window(bank, sim, window, f_lower):
                                                  getattr(sim, 'mass2'),
                                                  f_lower)
     return abs(b_tau0 - s_tau0) > window
+
+
+#############################
+
+
+def table_columns(table, columns=('mass1', 'mass2')):
+    """
+    Read `columns` of all rows of a LIGOLW table at once, into a NumPy
+    record array with one float field per column.
+    """
+    cols = np.recarray(len(table), dtype=[(c, float) for c in columns])
+    for c in columns:
+        cols[c] = [getattr(row, c) for row in table]
+    return cols
+
+
+def mchirp_tau0_from_table(table, f_lower):
+    """
+    Project a sim_inspiral / sngl_inspiral table onto arrays of the chirp
+    mass and tau0 of its rows, computed in one vectorized call each.
+    """
+    cols = table_columns(table, ('mass1', 'mass2'))
+    mchirp, _ = pnutils.mass1_mass2_to_mchirp_eta(cols.mass1, cols.mass2)
+    tau0, _ = pnutils.mass1_mass2_to_tau0_tau3(cols.mass1, cols.mass2,
+                                               f_lower)
+    return mchirp, tau0
+
+
+def outside_mchirp_window_mask(bank_mchirp, sim_mchirp, w):
+    """
+    `outside_mchirp_window` for arrays of chirp masses. Returns a boolean
+    array of shape (len(bank_mchirp), len(sim_mchirp)), True for the pairs
+    that are outside the window.
+    """
+    bank_mchirp = np.asarray(bank_mchirp, dtype=float)[:, None]
+    sim_mchirp = np.asarray(sim_mchirp, dtype=float)[None, :]
+    return np.abs(sim_mchirp - bank_mchirp) > (w * bank_mchirp)
+
+
+def outside_tau0_window_mask(bank_tau0, sim_tau0, window):
+    """
+    `outside_tau0_window` for arrays of tau0 values. Returns a boolean
+    array of shape (len(bank_tau0), len(sim_tau0)), True for the pairs
+    that are outside the window.
+    """
+    bank_tau0 = np.asarray(bank_tau0, dtype=float)[:, None]
+    sim_tau0 = np.asarray(sim_tau0, dtype=float)[None, :]
+    return np.abs(bank_tau0 - sim_tau0) > window
+
+
+def window_candidate_pairs(bank_mchirp,
+                           sim_mchirp,
+                           mchirp_window=0,
+                           bank_tau0=None,
+                           sim_tau0=None,
+                           tau0_window=0):
+    """
+    Sparse list of the (bank, sim) pairs within the chirp mass and tau0
+    windows, i.e. for which neither `outside_mchirp_window(bank, sim, w)`
+    nor `outside_tau0_window` holds. A window of 0 disables that cut.
+
+    Pairs are found by binary search over the sorted bank chirp masses, so
+    that the dense len(bank) x len(sim) mask is never built. Returns the
+    arrays of bank and sim indices of the pairs, sorted by sim index and
+    then by bank index.
+    """
+    # {{{
+    bank_mchirp = np.asarray(bank_mchirp, dtype=float)
+    sim_mchirp = np.asarray(sim_mchirp, dtype=float)
+    nb, ns = len(bank_mchirp), len(sim_mchirp)
+    w = mchirp_window
+    if w:
+        # |s - b| <= w * b  <=>  s / (1 + w) <= b <= s / (1 - w). The
+        # bounds are widened slightly, and the exact condition checked.
+        order = np.argsort(bank_mchirp, kind='mergesort')
+        sorted_mchirp = bank_mchirp[order]
+        lo = np.searchsorted(sorted_mchirp,
+                             sim_mchirp / (1. + w) * (1. - 1e-9),
+                             side='left')
+        if w < 1:
+            hi = np.searchsorted(sorted_mchirp,
+                                 sim_mchirp / (1. - w) * (1. + 1e-9),
+                                 side='right')
+        else:
+            hi = np.full(ns, nb)
+        counts = hi - lo
+        sim_idx = np.repeat(np.arange(ns), counts)
+        offsets = np.arange(counts.sum()) - np.repeat(
+            np.cumsum(counts) - counts, counts)
+        bank_idx = order[np.repeat(lo, counts) + offsets]
+        keep = np.abs(sim_mchirp[sim_idx] - bank_mchirp[bank_idx]) <= \
+            w * bank_mchirp[bank_idx]
+        bank_idx, sim_idx = bank_idx[keep], sim_idx[keep]
+    else:
+        bank_idx = np.tile(np.arange(nb), ns)
+        sim_idx = np.repeat(np.arange(ns), nb)
+    if tau0_window and bank_tau0 is not None and sim_tau0 is not None:
+        keep = np.abs(np.asarray(bank_tau0)[bank_idx] -
+                      np.asarray(sim_tau0)[sim_idx]) <= tau0_window
+        bank_idx, sim_idx = bank_idx[keep], sim_idx[keep]
+    order = np.lexsort((bank_idx, sim_idx))
+    return bank_idx[order], sim_idx[order]
+    # }}}
+
+
+class ChirpMassWindowIndex(object):
+    """
+    Rows of a table sorted by chirp mass, so that the rows that fall within
+    the chirp mass (and tau0) window of a given point are found by binary
+    search instead of a scan.
+
+    The windows are those of `outside_mchirp_window(point, row, w)` and
+    `outside_tau0_window(point, row, window, f_lower)`, i.e. the chirp mass
+    window is relative to the query point's chirp mass.
+    """
+    def __init__(self, mchirp, tau0=None):
+        mchirp = np.asarray(mchirp, dtype=float)
+        self.order = np.argsort(mchirp, kind='mergesort')
+        self.mchirp = mchirp[self.order]
+        self.tau0 = None if tau0 is None else np.asarray(tau0)[self.order]
+
+    def __len__(self):
+        return len(self.mchirp)
+
+    def candidates(self, mchirp, mchirp_window=0, tau0=None, tau0_window=0):
+        """
+        Indices (into the arrays the index was built from, in ascending
+        order) of rows within the windows around the query point. A window
+        of 0 disables that cut.
+        """
+        if mchirp_window:
+            lo = np.searchsorted(self.mchirp,
+                                 mchirp - mchirp_window * mchirp,
+                                 side='left')
+            hi = np.searchsorted(self.mchirp,
+                                 mchirp + mchirp_window * mchirp,
+                                 side='right')
+        else:
+            lo, hi = 0, len(self.mchirp)
+        idx = self.order[lo:hi]
+        if tau0_window and self.tau0 is not None:
+            idx = idx[np.abs(self.tau0[lo:hi] - tau0) <= tau0_window]
+        return np.sort(idx)
+
+    def covers(self, mchirp, mchirp_window=0):
+        """
+        Mask of the chirp masses `mchirp` that fall within the chirp mass
+        window of at least one indexed row, i.e. of the points that some
+        `candidates(row_mchirp, mchirp_window)` query would return. The
+        bounds are widened by one part in 1e9, so that rounding can only
+        add points to the mask, never drop them.
+        """
+        mchirp = np.asarray(mchirp, dtype=float)
+        if not mchirp_window or len(self.mchirp) == 0:
+            return np.full(len(mchirp), len(self.mchirp) > 0)
+        lo = mchirp / (1. + mchirp_window) * (1. - 1e-9)
+        if mchirp_window < 1:
+            hi = mchirp / (1. - mchirp_window) * (1. + 1e-9)
+        else:
+            hi = np.full(len(mchirp), np.inf)
+        return np.searchsorted(self.mchirp, hi, side='right') > \
+            np.searchsorted(self.mchirp, lo, side='left')
+
+
+class ChirpMassEccentricityIndex(object):
+    """
+    Points kept sorted by chirp mass as they are added one at a time, so
+    that whether a new point lies within the chirp mass and eccentricity
+    windows of any of them is found by bisection instead of a scan.
+
+    Two points are within each other's windows when
+    |mc1 - mc2| < mchirp_window * min(mc1, mc2) and
+    |e1 - e2| < ecc_window. Non-positive windows match nothing.
+    """
+    def __init__(self, mchirp_window, ecc_window):
+        self.mchirp_window = mchirp_window
+        self.ecc_window = ecc_window
+        self.mchirp = []
+        self.ecc = []
+
+    def __len__(self):
+        return len(self.mchirp)
+
+    def add(self, mchirp, ecc):
+        """Insert one point, keeping the index sorted"""
+        idx = bisect.bisect_right(self.mchirp, mchirp)
+        self.mchirp.insert(idx, mchirp)
+        self.ecc.insert(idx, ecc)
+
+    def extend(self, mchirp, ecc):
+        """Insert many points at once, with a single sort"""
+        mchirp = np.append(self.mchirp, mchirp)
+        ecc = np.append(self.ecc, ecc)
+        order = np.argsort(mchirp, kind='mergesort')
+        self.mchirp = list(mchirp[order])
+        self.ecc = list(ecc[order])
+
+    def within_windows(self, mchirp, ecc):
+        """
+        Whether the point (mchirp, ecc) lies within the windows of any
+        indexed point
+        """
+        w = self.mchirp_window
+        if w <= 0 or self.ecc_window <= 0:
+            return False
+        # Points within the chirp mass window lie in (mc / (1 + w),
+        # mc * (1 + w)). The bisection bounds are widened slightly, and the
+        # exact condition checked for each point in between.
+        lo = bisect.bisect_left(self.mchirp, mchirp / (1. + w) * (1. - 1e-9))
+        hi = bisect.bisect_right(self.mchirp, mchirp * (1. + w) * (1. + 1e-9))
+        for k in range(lo, hi):
+            if abs(mchirp - self.mchirp[k]) < w * min(mchirp, self.mchirp[k]) \
+                    and abs(ecc - self.ecc[k]) < self.ecc_window:
+                return True
+        return False
@@ -13,6 +13,10 @@ import os
 import h5py
 
 import numpy as np
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
 
 from .single_mode import nr_mode
 ######################################################################
@@ -28,6 +32,47 @@ verbose = False
 ## - "nr_strain" / "nr_wave" as manipulation class for GW strain
 ## Each class depends on the all previous ones.
 #
+######################################################################
+######################################################################
+#
+#   Make a container that reads NR modes on first access
+#
+######################################################################
+######################################################################
+class lazy_mode_dict(Mapping):
+    #{{{
+    def __init__(self, loader, modes):
+        """
+Read-only dictionary {modeM : nr_mode} for the modes of one modeL.
+
+loader: callable that takes modeM and returns its nr_mode
+modes : modeM values that can be read
+
+Each mode is created on first access and kept afterwards.
+        """
+        self.loader = loader
+        self.available = [int(modeM) for modeM in modes]
+        self.loaded = {}
+
+    def __getitem__(self, modeM):
+        if modeM not in self.available:
+            raise KeyError(modeM)
+        if modeM not in self.loaded:
+            self.loaded[modeM] = self.loader(modeM)
+        return self.loaded[modeM]
+
+    def __iter__(self):
+        return iter(self.available)
+
+    def __len__(self):
+        return len(self.available)
+
+    def is_loaded(self, modeM):
+        return modeM in self.loaded
+
+    #}}}
+
+
 ######################################################################
 ######################################################################
 #
@@ -49,6 +94,7 @@ class nr_data():
                  modeLmin=2,
                  modeLmax=4,
                  skipM0=True,
+                 which_modes=None,
                  delta_t=1.0,
                  verbose=0):
         """
@@ -79,6 +125,11 @@ class nr_data():
 ### 6. modeLmin, modeLmax: Range of l-modes of strain to use
             (cannot use arbitrary ones yet)
 ### 7. skipM0: Skip m=0 (DC) modes (Default: True)
+### 8. which_modes: list of (l,m) tuples. If given, only these modes are
+            made available. Otherwise all modes in [modeLmin, modeLmax]
+
+#### HDF5 modes are read from the (open, read-only) file the first time
+#### they are accessed as self.modes[l][m]. Close the file with close().
 
         """
         ## Check inputs
@@ -101,12 +152,43 @@ class nr_data():
         self.modeLmin = modeLmin
         self.modeLmax = modeLmax
         self.delta_t = delta_t
+        if which_modes is not None and len(which_modes) > 0:
+            self.which_modes = [(int(l), int(m)) for (l, m) in which_modes]
+        else:
+            self.which_modes = None
 
         self.fin = h5py.File(self.filename, 'r')
         self.modes = {}
         self.read_nr_data()
         return
 
+    def close(self):
+        """Close the HDF5 file. Modes not yet read can no longer be read."""
+        if self.fin is not None:
+            self.fin.close()
+            self.fin = None
+        return self
+
+    def mode_is_requested(self, modeL, modeM):
+        if self.skipM0 and modeM == 0: return False
+        if self.which_modes is None: return True
+        return (modeL, modeM) in self.which_modes
+
+    def data_durations(self):
+        ## Durations (in M) of all available modes. Reads them if needed.
+        return [
+            self.modes[modeL][modeM].data_duration() for modeL in self.modes
+            for modeM in self.modes[modeL]
+        ]
+
+    @property
+    def MAX_DURATION_M(self):
+        return np.max(self.data_durations())
+
+    @property
+    def MIN_DURATION_M(self):
+        return np.min(self.data_durations())
+
     def read_nr_data(self):
         ##{{{
         if 'HDF' in self.filetype:
@@ -126,15 +208,13 @@ class nr_data():
             if self.verbose > 0:
                 print("Reading NR data in ASCII from {}".format(self.filename))
             ####
-            ## Read modes
-            MAXLEN, MINLEN = -1, 1e100
             ## Create output dictionary
             self.modes = {}
             ## Loop over modes
             for modeL in np.arange(2, self.modeLmax + 1):
                 self.modes[modeL] = {}
                 for modeM in np.arange(-1 * modeL, modeL + 1):
-                    if self.skipM0 and modeM == 0: continue
+                    if not self.mode_is_requested(modeL, modeM): continue
                     ## Get dataset for this mode
                     try:
                         mdata = np.loadtxt(self.filename % (modeL, modeM))
@@ -150,13 +230,6 @@ class nr_data():
                     self.modes[modeL][modeM] = nr_mode(mdata,
                                                        delta_t=self.delta_t,
                                                        verbose=self.verbose)
-                    ## Measure maximum duration of any mode
-                    MINLEN = np.minimum(
-                        MINLEN, self.modes[modeL][modeM].data_duration())
-                    MAXLEN = np.maximum(
-                        MAXLEN, self.modes[modeL][modeM].data_duration())
-                self.MAX_DURATION_M = MAXLEN
-                self.MIN_DURATION_M = MINLEN
                 ## If no (l,m) mode is found for a given (l), pop it
                 if len(self.modes[modeL]) == 0: self.modes.pop(modeL)
                 ## If no (l) item exists in self.modes, no data has been read at ALL!
@@ -173,8 +246,6 @@ class nr_data():
                 print("Reading NR data in ASCII from {}".format(self.filename))
             ## filename is NOT really filename, its a DICTIONARY
             dataset = self.filename
-            ## Read Modes
-            MAXLEN, MINLEN = -1, 1e100
             ## Create output dictionary
             self.modes = {}
             for modeL in dataset:
@@ -182,7 +253,7 @@ class nr_data():
                 self.modes[modeL] = {}
                 for modeM in dataset[modeL]:
                     modeM = int(modeM)
-                    if self.skipM0 and modeM == 0: continue
+                    if not self.mode_is_requested(modeL, modeM): continue
                     ## Get dataset for this mode
                     try:
                         mdata = dataset[modeL][modeM]
@@ -198,13 +269,6 @@ class nr_data():
                     self.modes[modeL][modeM] = nr_mode(mdata,
                                                        delta_t=self.delta_t,
                                                        verbose=self.verbose)
-                    ## Measure maximum duration of any mode
-                    MINLEN = np.minimum(
-                        MINLEN, self.modes[modeL][modeM].data_duration())
-                    MAXLEN = np.maximum(
-                        MAXLEN, self.modes[modeL][modeM].data_duration())
-            self.MAX_DURATION_M = MAXLEN
-            self.MIN_DURATION_M = MINLEN
             ###############
         else:
             raise IOError("DataSets not accepted in this format. Read HELP.")
@@ -294,42 +358,39 @@ class nr_data():
         ##}}}
     def read_nr_mode_data_hdf5_group(self, wavedata):
         ##{{{
-        ## Create output dictionary
+        ## Create output dictionary. Only the names of datasets are read
+        ## here, each mode is read and interpolated on first access.
         self.modes = {}
-        if True:
-            ## Read modes
-            MAXLEN, MINLEN = -1, 1e100
-            for modeL in np.arange(self.modeLmin, self.modeLmax + 1):
-                self.modes[modeL] = {}
-                for modeM in np.arange(modeL, -1 * modeL - 1, -1):
-                    if self.skipM0 and modeM == 0: continue
-                    ## Get dataset for this mode
-                    try:
-                        if self.verbose > 2:
-                            print("\t\tTrying to read: %d,%d mode" %
-                                  (modeL, modeM))
-                        mdata = wavedata['Y_l{}_m{}.dat'.format(modeL,
-                                                                modeM)].value
-                        if self.verbose > 2:
-                            print("\t\tShape of data read is ",
-                                  np.shape(mdata))
-                    except:
-                        if self.verbose > 0:
-                            print("WARNING: Ignoring mode ({},{})".format(
-                                modeL, modeM))
-                        continue
-                    ## Initialize a nr_mode class with this dataset
-                    self.modes[modeL][modeM] = nr_mode(mdata,
-                                                       delta_t=self.delta_t,
-                                                       verbose=self.verbose)
-                    ## Measure maximum duration of any mode
-                    MINLEN = np.minimum(
-                        MINLEN, self.modes[modeL][modeM].data_duration())
-                    MAXLEN = np.maximum(
-                        MAXLEN, self.modes[modeL][modeM].data_duration())
-            self.MAX_DURATION_M = MAXLEN
-            self.MIN_DURATION_M = MINLEN
+        datasets = set(str(k) for k in wavedata.keys())
+        for modeL in np.arange(self.modeLmin, self.modeLmax + 1):
+            modeL = int(modeL)
+            modeMs = []
+            for modeM in np.arange(modeL, -1 * modeL - 1, -1):
+                modeM = int(modeM)
+                if not self.mode_is_requested(modeL, modeM): continue
+                if 'Y_l{}_m{}.dat'.format(modeL, modeM) not in datasets:
+                    if self.verbose > 0:
+                        print("WARNING: Ignoring mode ({},{})".format(
+                            modeL, modeM))
+                    continue
+                modeMs.append(modeM)
+            if len(modeMs) == 0: continue
+            self.modes[modeL] = lazy_mode_dict(
+                self.hdf5_mode_reader(wavedata, modeL), modeMs)
         return self
         ##}}}
+    def hdf5_mode_reader(self, wavedata, modeL):
+        ##{{{
+        def read_mode(modeM):
+            if self.verbose > 2:
+                print("\t\tReading: %d,%d mode" % (modeL, modeM))
+            mdata = wavedata['Y_l{}_m{}.dat'.format(modeL, modeM)][()]
+            if self.verbose > 2:
+                print("\t\tShape of data read is ", np.shape(mdata))
+            ## Initialize a nr_mode class with this dataset
+            return nr_mode(mdata, delta_t=self.delta_t, verbose=self.verbose)
+
+        return read_mode
+        ##}}}
 
     #}}}
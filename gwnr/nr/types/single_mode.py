@@ -56,7 +56,7 @@ verbose = False
 #
 ######################################################################
 ######################################################################
-class nr_mode():
+class nr_mode(object):
     # {{{
     def __init__(self, mode_data, delta_t=1.0, verbose=0):
         """
@@ -99,48 +99,83 @@ Returns mode frequency as a numpy.FLOAT64 array
         self.t_samples = t_samples
         self.mode_samples = mode_samples
 
-        # Create interpolation splines for the mode
-        re_int = InterpolatedUnivariateSpline(t_samples, np.real(mode_samples))
-        im_int = InterpolatedUnivariateSpline(t_samples, np.imag(mode_samples))
-        self.mode_real_interp = re_int
-        self.mode_imag_interp = im_int
-
-        # Create a resampled COMPLEX mode array TimeSeries
+        # Interpolation splines for the mode, and the resampled COMPLEX mode
+        # array TimeSeries, are created on first use
+        self._mode_real_interp = None
+        self._mode_imag_interp = None
+        self._mode_array = None
+        # Amplitude, phase and frequency of the current mode array
+        self._derived = {}
         self.dimLess = True
-        _ = self.resample(delta_t)
         return
 
     ##
 
+    @property
+    def mode_real_interp(self):
+        if self._mode_real_interp is None:
+            self._mode_real_interp = InterpolatedUnivariateSpline(
+                self.t_samples, np.real(self.mode_samples))
+        return self._mode_real_interp
+
+    @property
+    def mode_imag_interp(self):
+        if self._mode_imag_interp is None:
+            self._mode_imag_interp = InterpolatedUnivariateSpline(
+                self.t_samples, np.imag(self.mode_samples))
+        return self._mode_imag_interp
+
+    @property
+    def mode_array(self):
+        if self._mode_array is None:
+            self._mode_array = self.interpolate_mode_array(self.delta_t)
+        return self._mode_array
+
+    @mode_array.setter
+    def mode_array(self, mode_array):
+        self._mode_array = mode_array
+        self._derived = {}
+
+    ##
+
+    def interpolate_mode_array(self, delta_t):
+        """
+Evaluate the mode on a uniform grid of step delta_t (in units of M), with
+the epoch set to place the amplitude peak at t=0
+        """
+        t_array = np.arange(np.min(self.t_samples), np.max(self.t_samples),
+                            delta_t)
+        mode_array = self.mode_real_interp(
+            t_array) + self.mode_imag_interp(t_array) * 1.0j
+        mode_array = TimeSeries(mode_array, delta_t=delta_t, copy=True)
+        find_max_start = len(mode_array) * 4 // 5
+        max_idx = find_max_start + \
+            mode_array[find_max_start:].abs_max_loc()[-1]
+        if self.verbose > 1:
+            print("\t\tMax of mode found at index: {}".format(max_idx))
+        # Set epoch of mode to place amplitude peak at t=0
+        return TimeSeries(mode_array,
+                          epoch=lal.LIGOTimeGPS(
+                              -1. * mode_array.sample_times[max_idx]),
+                          copy=True)
+
+    ##
+
     def resample(self, delta_t):
         """
 Resample all data to a new sample rate.
 
 Takes in the new sampling time step, in units of total mass M
+
+The resampled data is computed when it is next used.
         """
-        if delta_t != self.delta_t or not hasattr(self, "mode_array"):
+        if delta_t != self.delta_t or not self.dimLess or \
+                self._mode_array is None:
             if verbose > 0:
                 print("Resampling mode data to sample rate: {} (1/M)".format(
                     1. / delta_t))
             self.delta_t = delta_t
-            t_array = np.arange(np.min(self.t_samples), np.max(self.t_samples),
-                                delta_t)
-            mode_array = self.mode_real_interp(
-                t_array) + self.mode_imag_interp(t_array) * 1.0j
-            self.mode_array = TimeSeries(mode_array,
-                                         delta_t=delta_t,
-                                         copy=True)
-            find_max_start = len(self.mode_array) * 4 / 5
-            max_idx = find_max_start + \
-                self.mode_array[find_max_start:].abs_max_loc()[-1]
-            if self.verbose > 1:
-                print("\t\tMax of mode found at index: {}".format(max_idx))
-            # Set epoch of mode to place amplitude peak at t=0
-            self.mode_array = TimeSeries(
-                self.mode_array,
-                epoch=lal.LIGOTimeGPS(-1. *
-                                      self.mode_array.sample_times[max_idx]),
-                copy=True)
+            self.mode_array = None
         self.dimLess = True
         self.totalmass = None
         self.distance = None
@@ -189,14 +224,32 @@ Takes in the total mass M (in units of solar masses)
 
     ##
 
+    def cached(self, key, compute):
+        """
+Return a copy of the series computed by compute(), which is memoized under
+key until the mode is next resampled
+        """
+        if key not in self._derived:
+            self._derived[key] = compute()
+        series = self._derived[key]
+        return TimeSeries(series,
+                          delta_t=series.delta_t,
+                          epoch=series._epoch,
+                          copy=True)
+
+    ##
+
     def amplitude(self, startIdx=0, stopIdx=-1):
         """
 Return the amplitude TimeSeries of the mode
         """
-        return TimeSeries(np.abs(self.mode_array[startIdx:stopIdx]),
-                          delta_t=self.mode_array.delta_t,
-                          epoch=self.mode_array._epoch,
-                          copy=True)
+        def compute():
+            return TimeSeries(np.abs(self.mode_array[startIdx:stopIdx]),
+                              delta_t=self.mode_array.delta_t,
+                              epoch=self.mode_array._epoch,
+                              copy=True)
+
+        return self.cached(('amplitude', startIdx, stopIdx), compute)
 
     ##
 
@@ -204,15 +257,18 @@ Return the amplitude TimeSeries of the mode
         """
 Return the phase TimeSeries of the mode
         """
-        re_array = self.mode_array.real()[startIdx:stopIdx]
-        im_array = self.mode_array.imag()[startIdx:stopIdx]
-        ph_array = phase_from_polarizations(re_array, -1 * im_array)
-        return TimeSeries(
-            ph_array,
-            delta_t=self.mode_array.delta_t,
-            epoch=self.mode_array.
-            _epoch,  # FIXME: BUG HERE IF USING PART OF ARRAY?
-            copy=True)
+        def compute():
+            re_array = self.mode_array.real()[startIdx:stopIdx]
+            im_array = self.mode_array.imag()[startIdx:stopIdx]
+            ph_array = phase_from_polarizations(re_array, -1 * im_array)
+            return TimeSeries(
+                ph_array,
+                delta_t=self.mode_array.delta_t,
+                epoch=self.mode_array.
+                _epoch,  # FIXME: BUG HERE IF USING PART OF ARRAY?
+                copy=True)
+
+        return self.cached(('phase', startIdx, stopIdx), compute)
 
     ##
 
@@ -229,14 +285,31 @@ Return the angular velocity TimeSeries of the mode, in units (radians per time U
         """
 Return the frequency TimeSeries of the mode, in units (cycles per time Unit)
         """
-        _phase = self.phase(startIdx=startIdx, stopIdx=stopIdx)
-        phase_deriv_interp = InterpolatedUnivariateSpline(
-            _phase.sample_times, _phase.data).derivative(n=1)
-        _frequency = phase_deriv_interp(_phase.sample_times) / 2. / np.pi
-        return TimeSeries(_frequency,
-                          delta_t=_phase.delta_t,
-                          epoch=_phase._epoch,
-                          copy=True)
+        def compute():
+            _phase = self.phase(startIdx=startIdx, stopIdx=stopIdx)
+            phase_deriv_interp = InterpolatedUnivariateSpline(
+                _phase.sample_times, _phase.data).derivative(n=1)
+            _frequency = phase_deriv_interp(_phase.sample_times) / 2. / np.pi
+            return TimeSeries(_frequency,
+                              delta_t=_phase.delta_t,
+                              epoch=_phase._epoch,
+                              copy=True)
+
+        return self.cached(('frequency', startIdx, stopIdx), compute)
+
+    ##
+
+    def frequency_interp(self):
+        """
+Return a spline of the (full) frequency TimeSeries of the mode as a function
+of time, in the current units. It is memoized until the mode is resampled.
+        """
+        key = ('frequency_interp', )
+        if key not in self._derived:
+            freq = self.frequency()
+            self._derived[key] = InterpolatedUnivariateSpline(
+                freq.sample_times, freq)
+        return self._derived[key]
 
     ##
 
@@ -38,6 +38,7 @@ from pycbc.types import *
 from pycbc.filter import *
 
 from gwnr.nr.types import nr_data
+from gwnr.nr.utils import SpinWeightedSphericalHarmonics
 from gwnr.utils import zero_pad_beginning
 from gwnr.waveform.utils import get_time_at_frequency
 ######################################################################
@@ -250,7 +251,7 @@ The following do NOT change OR care about the state:
         self.modeLmax = modeLmax
         self.modeLmin = modeLmin
         self.skipM0 = skipM0
-        self.which_modes = which_modes
+        self.which_modes = list(which_modes)
 
         # Binary parameters
         self.totalmass = totalmass
@@ -276,10 +277,15 @@ The following do NOT change OR care about the state:
             print("self.n = ", self.n)
 
         ##################################################################
-        #   2. Read the data from the file. Read all modes.
+        #   2. Open the data file. Modes are read on first access, and only
+        #      those in which_modes (all, if it is empty). The (2,2) mode
+        #      sets the reference time and phase, so it is always kept.
         ##################################################################
         if self.verbose > 1:
             print("Init nr_wave: Reading data....")
+        modes_to_read = list(self.which_modes)
+        if len(modes_to_read) > 0 and (2, 2) not in modes_to_read:
+            modes_to_read.append((2, 2))
         self.data = nr_data(filename,
                             filetype=filetype,
                             wavetype=wavetype,
@@ -288,6 +294,7 @@ The following do NOT change OR care about the state:
                             modeLmin=self.modeLmin,
                             modeLmax=self.modeLmax,
                             skipM0=self.skipM0,
+                            which_modes=modes_to_read,
                             delta_t=1.0 / dimless_sample_rate,
                             verbose=self.verbose)
         self.which_modes_to_read()
@@ -447,7 +454,7 @@ Get 2,2-mode GW_frequency in Hz at a given time (in M)
         #    self.rescale_to_totalmass(totalmass)
 
         freq = self.get_mode_frequency(modeL=2, modeM=2)
-        freqI = InterpolatedUnivariateSpline(freq.sample_times, freq)
+        freqI = self.data.modes[2][2].frequency_interp()
 
         f_is_dimless = self.data.modes[2][2].dimLess
 
@@ -704,6 +711,69 @@ Return plus and cross polarizations.
             print("\tComputing polarizations for: delta_t={}, M={}, dist={}, incl={}, phi={}".format(\
                         delta_t, M, distance, inclination, phi))
         #########################################################
+        #### COMBINE MODES TO GET POLARIZATIONS
+        #########################################################
+        hps, hcs = self.get_polarizations_for_orientations(
+            inclination, phi, delta_t=delta_t, M=M, distance=distance)
+        self.rescaled_hp, self.rescaled_hc = hps[0], hcs[0]
+        # Return polarizations
+        return [self.rescaled_hp, self.rescaled_hc]
+        ##}}}
+
+    ##
+    def get_mode_matrix(self):
+        """
+Return [modes, matrix], where matrix is a contiguous complex array of shape
+(len(modes), n) whose rows are the (l, m) modes listed in modes, in the
+object's current units. All rows start at the first sample of the (2,2)
+mode and are zero-padded to length n.
+
+The matrix is rebuilt only when the modes are resampled or rescaled.
+
+** Object's S1 state is NOT CHANGED. **
+        """
+        ##{{{
+        modes = [(modeL, modeM)
+                 for (modeL, modeM) in self.which_modes_to_read()
+                 if not (self.skipM0 and modeM == 0)]
+        h22 = self.data.modes[2][2]
+        key = (tuple(modes), h22.dimLess, h22.delta_t, h22.totalmass,
+               h22.distance)
+        if getattr(self, 'mode_matrix_key', None) == key:
+            return self.mode_matrix
+        matrix = np.zeros((len(modes), self.n), dtype=np.complex128)
+        for idx, (modeL, modeM) in enumerate(modes):
+            hlm = self.data.modes[modeL][modeM].data().data
+            matrix[idx, :len(hlm)] = hlm[:self.n]
+        self.mode_matrix = [modes, matrix]
+        self.mode_matrix_key = key
+        return self.mode_matrix
+        ##}}}
+
+    ##
+    def get_polarizations_for_orientations(self,
+                                           inclinations,
+                                           phis,
+                                           delta_t=None,
+                                           M=None,
+                                           distance=None):
+        """
+Return plus and cross polarizations for K orientations (inclinations[k],
+phis[k]) of the source, as two lists of TimeSeries.
+
+The modes are rescaled once. Then, with Y the (K x n_modes) matrix of
+spin -2 weighted spherical harmonics and H the (n_modes x n) mode matrix
+(see get_mode_matrix),
+    h+ - i hx = Y @ H
+for all orientations at once.
+
+** Object's S1 state is CHANGED to "dimensionfull. **
+        """
+        ##{{{
+        if delta_t is None: delta_t = self.delta_t
+        if M is None: M = self.totalmass
+        if distance is None: distance = self.distance
+        #########################################################
         #### RESCALE AND RESAMPLE INDIVIDUAL MODES
         #########################################################
         # First rescale all modes to required physical parameters
@@ -718,71 +788,157 @@ Return plus and cross polarizations.
             print(
                 "\t\t\tFound peak of amplitude of h22 at (index, ampl): {}, {}"
                 .format(iPeak, aPeak))
-        phase22 = self.get_mode_phase(2, 2)
-        #phiOrbMerger = phase22[iPeak] / 2.
-        phiOrbMerger = np.angle(self.data.modes[2][2].data()[iPeak]) / -2
+        curr_h22 = self.data.modes[2][2].data()
+        phiOrbMerger = np.angle(curr_h22[iPeak]) / -2
 
         #########################################################
         #### COMBINE MODES TO GET POLARIZATIONS
         #########################################################
-        # Create an empty complex array for (+ , x) polarizations
-        hpols = TimeSeries(np.zeros(self.n, dtype=float) +
-                           np.zeros(self.n, dtype=float) * 1.0j,
-                           delta_t=delta_t,
-                           epoch=phase22._epoch)
-        curr_h22 = self.data.modes[2][2].data()
-        # Loop over all modes to be included
-        for (modeL, modeM) in self.which_modes_to_read():
-            if self.skipM0 and modeM == 0: continue
-            #phiOrbMerger = np.angle(self.data.modes[modeL][modeM].data()[iPeak]) * (1.0 / modeM) ## FIXME!!
-            #print type(hpols), hpols.dtype
-            # Compute spin -2 weighted Ylm for (inclination, PHI??)
-            curr_ylm_lal = lal.SpinWeightedSphericalHarmonic(
-                inclination,
-                phiOrbMerger - 0 * np.pi / 4. - phi,
-                #phiOrbMerger  - phi,
-                -2,
-                modeL,
-                modeM)
-            #print type(curr_ylm_lal)
-            curr_ylm = np.complex128(curr_ylm_lal.real +
-                                     curr_ylm_lal.imag * 1.0j)
-            #print np.abs(curr_ylm)
-            #print "Difference: {}",format(np.abs(curr_ylm_lal - curr_ylm))
-
-            # h+ - \ii hx = \Sum Ylm * hlm
-            tmp_hlm = self.data.modes[modeL][modeM].data()
-            ## FIXME DELME
-            if self.verbose > 2:
-                null_ylm = np.exp(1 * (phiOrbMerger - 0 * np.pi / 4. - phi) *
-                                  modeM * 1.0j)
-                print("\t\t\tPhaseRemovalTerm: ", null_ylm)
-                print(
-                    "\t\t\tUSENR mode at peak: {}, after removing phase: {} ({})"
-                    .format(tmp_hlm[iPeak], null_ylm * tmp_hlm[iPeak],
-                            np.angle(null_ylm * tmp_hlm[iPeak])))
-
-            curr_hlm = TimeSeries(tmp_hlm * curr_ylm,
-                                  epoch=curr_h22._epoch,
-                                  dtype=hpols.dtype,
-                                  copy=True)
-            if self.verbose > 1:
-                print("\tShifted ({},{}) in time by {} units ({} samples)".
-                      format(
-                          modeL, modeM,
-                          float(curr_hlm._epoch - tmp_hlm._epoch),
-                          float(curr_hlm._epoch - tmp_hlm._epoch) /
-                          curr_hlm.delta_t))
-            hpols[:len(curr_hlm)] += curr_hlm
+        modes, matrix = self.get_mode_matrix()
+        inclinations, phis = np.broadcast_arrays(
+            np.atleast_1d(np.asarray(inclinations, dtype=float)),
+            np.atleast_1d(np.asarray(phis, dtype=float)))
+        # Compute spin -2 weighted Ylm for (inclination, PHI??)
+        ylms = SpinWeightedSphericalHarmonics(inclinations,
+                                              phiOrbMerger - phis,
+                                              modes,
+                                              s=-2)
         # h+ - \ii hx = \Sum Ylm * hlm
-        self.rescaled_hp = TimeSeries(hpols.real(),
-                                      delta_t=hpols.delta_t,
-                                      epoch=hpols._epoch)
-        self.rescaled_hc = TimeSeries(-1 * hpols.imag(),
-                                      delta_t=hpols.delta_t,
-                                      epoch=hpols._epoch)
-        # Return polarizations
-        return [self.rescaled_hp, self.rescaled_hc]
+        hpols = np.dot(ylms, matrix)
+        hps = [
+            TimeSeries(h.real, delta_t=delta_t, epoch=curr_h22._epoch)
+            for h in hpols
+        ]
+        hcs = [
+            TimeSeries(-1 * h.imag, delta_t=delta_t, epoch=curr_h22._epoch)
+            for h in hpols
+        ]
+        return [hps, hcs]
+        ##}}}
+
+    ##
+    def get_mode_spectra(self, pad_factor=4):
+        """
+Return the Fourier transforms of the dimensionless modes, as
+    [F, {(l, m) : (amplitude, phase)}, phiOrbMerger]
+where F are frequencies in units of (1/M) sorted in increasing order, and
+phiOrbMerger is the orbital phase at the amplitude peak of the (2,2) mode.
+
+Each mode is sampled at dimless_delta_t on the time stencil of the (2,2)
+mode (amplitude peak at t=0), zero-padded to at least pad_factor times its
+length, and Fourier transformed. This is done once, and is redone only if
+which_modes or dimless_delta_t change.
+
+** Object's S1 state is NOT CHANGED. **
+        """
+        ##{{{
+        which_modes = [(modeL, modeM)
+                       for (modeL, modeM) in self.which_modes_to_read()
+                       if not (self.skipM0 and modeM == 0)]
+        dt = self.dimless_delta_t
+        key = (dt, pad_factor, tuple(which_modes))
+        if getattr(self, 'mode_spectra_key', None) == key:
+            return self.mode_spectra
+        ##
+        h22 = self.data.modes[2][2].interpolate_mode_array(dt)
+        t0 = float(h22._epoch)
+        iPeak = np.argmin(np.abs(h22.sample_times.data))
+        phiOrbMerger = np.angle(h22[iPeak]) / -2
+        ##
+        N = max([
+            int(self.data.modes[modeL][modeM].data_duration() / dt) + 1
+            for (modeL, modeM) in which_modes
+        ])
+        Npad = 2**int(np.ceil(np.log2(pad_factor * N)))
+        F = np.fft.fftshift(np.fft.fftfreq(Npad, dt))
+        # All modes share the time stencil, and so the epoch, of (2,2)
+        time_shift = np.exp(-2.j * np.pi * F * t0)
+        spectra = {}
+        for (modeL, modeM) in which_modes:
+            if (modeL, modeM) == (2, 2): hlm = h22
+            else:
+                hlm = self.data.modes[modeL][modeM].interpolate_mode_array(dt)
+            hlm_tilde = np.fft.fftshift(np.fft.fft(hlm.data, n=Npad))
+            hlm_tilde *= dt * time_shift
+            spectra[(modeL, modeM)] = (np.abs(hlm_tilde),
+                                       np.unwrap(np.angle(hlm_tilde)))
+            if self.verbose > 2:
+                print("\t\tFourier transformed ({},{}) mode".format(
+                    modeL, modeM))
+        self.mode_spectra = [F, spectra, phiOrbMerger]
+        self.mode_spectra_key = key
+        return self.mode_spectra
+        ##}}}
+
+    ##
+    def get_polarizations_fd_for_masses(self,
+                                        masses,
+                                        delta_f=None,
+                                        f_lower=None,
+                                        distance=None,
+                                        inclination=None,
+                                        phi=None,
+                                        pad_factor=4):
+        """
+Return Fourier domain plus and cross polarizations for every total mass
+(in solar masses) in masses, as two lists of FrequencySeries.
+
+A mode rescaled to total mass M and distance R is (in geometric units)
+    h_lm(t) = (M/R) h_lm(t/M),  i.e.  h_lm(f) = (M/R) M h_lm(f M)
+so all masses come from one Fourier transform of each dimensionless mode
+(see get_mode_spectra), whose amplitude and phase are interpolated at the
+rescaled frequencies (f M). Nothing is re-interpolated in time.
+
+delta_f defaults to 1 / time_length, and frequencies go up to sample_rate/2.
+Samples below f_lower (if given), or above the Nyquist frequency of the
+dimensionless sampling, are zero. The time origin is at the amplitude peak
+of the (2,2) mode, like for get_polarizations.
+
+** Object's S1 state is NOT CHANGED. **
+        """
+        ##{{{
+        if delta_f is None: delta_f = self.df
+        if distance is None: distance = self.distance
+        if phi is None: phi = self.phi
+        if inclination is None: inclination = self.inclination
+        if distance is None or inclination is None or phi is None:
+            raise IOError(
+                "One of dist={}, incl={}, phi={} is None.\
+            Please provide valid parameters to obtain polarizations".format(
+                    distance, inclination, phi))
+        masses = np.atleast_1d(np.asarray(masses, dtype=float))
+        F, spectra, phiOrbMerger = self.get_mode_spectra(
+            pad_factor=pad_factor)
+        ##
+        frequencies = np.arange(int(0.5 * self.sample_rate / delta_f) +
+                                1) * delta_f
+        masses_secs = masses * lal.MTSUN_SI
+        fM = np.outer(masses_secs, frequencies)
+        # h(f) and h(-f), where h = h+ - i hx = Sum Ylm * hlm
+        h_pos = np.zeros(fM.shape, dtype=np.complex128)
+        h_neg = np.zeros(fM.shape, dtype=np.complex128)
+        modes = list(spectra.keys())
+        ylms = SpinWeightedSphericalHarmonics(inclination,
+                                              phiOrbMerger - phi,
+                                              modes,
+                                              s=-2)[0]
+        for curr_ylm, (modeL, modeM) in zip(ylms, modes):
+            amp, phase = spectra[(modeL, modeM)]
+            for sign, hpols in [(1., h_pos), (-1., h_neg)]:
+                hlm_amp = np.interp(sign * fM, F, amp, left=0., right=0.)
+                hlm_phase = np.interp(sign * fM, F, phase)
+                hpols += curr_ylm * hlm_amp * np.exp(1.j * hlm_phase)
+        # h+(f) = [h(f) + h(-f)*] / 2 and hx(f) = i [h(f) - h(-f)*] / 2
+        scaling = masses_secs * masses * lal.MRSUN_SI / (distance * lal.PC_SI)
+        hp = 0.5 * (h_pos + np.conj(h_neg)) * scaling[:, np.newaxis]
+        hc = 0.5j * (h_pos - np.conj(h_neg)) * scaling[:, np.newaxis]
+        if f_lower is not None:
+            hp[:, frequencies < f_lower] = 0
+            hc[:, frequencies < f_lower] = 0
+        ##
+        hps = [FrequencySeries(h, delta_f=delta_f, copy=False) for h in hp]
+        hcs = [FrequencySeries(h, delta_f=delta_f, copy=False) for h in hc]
+        return [hps, hcs]
         ##}}}
 
     ##
@@ -22,6 +22,8 @@
 #
 from __future__ import print_function
 
+from math import factorial
+
 import numpy as np
 
 ########################################
@@ -65,3 +67,38 @@ def PhaseFromPlanarOrbit(rVec):
     PhaseWrapped = np.arctan2(rVec[:, 1], rVec[:, 0])
     PhaseUnWrapped = np.unwrap(PhaseWrapped, discont=np.pi)
     return PhaseUnWrapped
+
+
+def SpinWeightedSphericalHarmonics(inclination, phi, modes, s=-2):
+    """
+    Evaluate the spin-weighted spherical harmonics sYlm(inclination, phi)
+    for all (l, m) in modes, and all pairs of angles, in one call. Uses the
+    same convention as lal.SpinWeightedSphericalHarmonic.
+
+    inclination and phi are scalars or arrays of the same length K.
+    Returns a complex array of shape (K, len(modes)).
+    """
+    theta = np.atleast_1d(np.asarray(inclination, dtype=float))
+    phi = np.atleast_1d(np.asarray(phi, dtype=float))
+    theta, phi = np.broadcast_arrays(theta, phi)
+    cos_half, sin_half = np.cos(theta / 2.), np.sin(theta / 2.)
+    ylm = np.zeros((len(theta), len(modes)), dtype=np.complex128)
+    for j, (l, m) in enumerate(modes):
+        l, m = int(l), int(m)
+        if l < abs(s) or abs(m) > l:
+            raise ValueError("Mode ({},{}) does not exist for s={}".format(
+                l, m, s))
+        norm = (-1)**m * np.sqrt(
+            factorial(l + m) * factorial(l - m) * (2. * l + 1) /
+            (4. * np.pi * factorial(l + s) * factorial(l - s)))
+        # Goldberg et al. (1967), with cot^p sin^2l = cos^p sin^(2l-p)
+        dlm = np.zeros(len(theta))
+        for r in range(max(0, m - s), min(l - s, l + m) + 1):
+            p = 2 * r + s - m
+            binom = factorial(l - s) * factorial(l + s) / (
+                factorial(r) * factorial(l - s - r) * factorial(r + s - m) *
+                factorial(l - r + m))
+            dlm += (-1)**(l - r - s) * binom * \
+                cos_half**p * sin_half**(2 * l - p)
+        ylm[:, j] = norm * dlm * np.exp(1.j * m * phi)
+    return ylm
@@ -32,6 +32,8 @@ from pycbc.detector import *
 from pycbc.waveform import get_td_waveform, get_fd_waveform
 from pycbc.types import FrequencySeries, TimeSeries
 
+from gwnr.analysis.psd import cached_psd_from_string
+
 _itime = time.time()
 verbose = True
 
@@ -253,7 +255,7 @@ def get_correlation_fisher_matrices(
         pass
     elif type(psd) == str:
         psd_name = psd
-        psd = from_string(psd_name, n, delta_f, f_lower)
+        psd = cached_psd_from_string(psd_name, n, delta_f, f_lower)
     else:
         raise IOError(
             "Either provide a psd compatible with waveforms (difficult) or a string"
@@ -96,6 +96,119 @@ def idempotence(N, x):
     return np.repeat(float(x), np.prod(N)).reshape(N)
 
 
+####
+# Vectorized sampling of binary parameters, used to draw test points and
+# bank points in blocks
+
+# Columns of the sampled binary points, all of which map onto SimInspiral
+# columns. 'sim_hash' holds the hex digits of the simulation_id.
+SAMPLE_POINT_COLUMNS = ['mass1', 'mass2', 'mchirp', 'eta',
+                        'spin1x', 'spin1y', 'spin1z',
+                        'spin2x', 'spin2y', 'spin2z',
+                        'alpha', 'alpha1', 'alpha2', 'coa_phase',
+                        'inclination', 'distance', 'polarization',
+                        'latitude', 'longitude']
+SAMPLE_POINT_DTYPE = [(c, float) for c in SAMPLE_POINT_COLUMNS] + \
+                     [('sim_hash', np.int64)]
+
+
+def uniform_spin_vectors(N, component_min, component_max, mag_min, mag_max):
+    """
+    Draw N spin vectors with components uniform within their range, and
+    rescale those whose magnitude falls outside [mag_min, mag_max] to a
+    magnitude drawn uniformly within it. Returns the x, y, z components.
+    """
+    s = uniform_bound(component_min, component_max, 3 * N).reshape(N, 3)
+    smag = np.sqrt((s**2).sum(axis=1))
+    rescale = ((smag > mag_max) | (smag < mag_min)) & (smag > 0)
+    new_smag = uniform_spin_magnitude(N, mag_min, mag_max)
+    s[rescale] *= (new_smag[rescale] / smag[rescale])[:, None]
+    return s[:, 0], s[:, 1], s[:, 2]
+
+
+def uniform_on_S2_window(N, lat_range, lon_range):
+    """
+    Draw N sky positions uniformly on the sphere within the given latitude
+    and longitude ranges, topping up with fresh draws until there are N of
+    them. Degenerate ranges are sampled uniformly in each angle instead.
+    """
+    (lat_min, lat_max), (lon_min, lon_max) = lat_range, lon_range
+    if lat_min == lat_max or lon_min == lon_max:
+        return uniform_bound(lat_min, lat_max, N),\
+            uniform_bound(lon_min, lon_max, N)
+    lat, lon = np.zeros(0), np.zeros(0)
+    while len(lat) < N:
+        _lat, _lon = cube_to_uniform_on_S2(uniform_bound(0, 1, N),
+                                           uniform_bound(0, 1, N))
+        keep = (_lat <= lat_max) & (_lat >= lat_min) &\
+            (_lon <= lon_max) & (_lon >= lon_min)
+        lat = np.append(lat, _lat[keep])
+        lon = np.append(lon, _lon[keep])
+    return lat[:N], lon[:N]
+
+
+def uniform_binary_points(N, mass_range, mtotal_range=None,
+                          fixed_masses=None,
+                          spin_component_range=(0., 0.),
+                          spin_mag_range=(0., 0.),
+                          eccentricity_range=(0., 0.),
+                          mean_per_ano_range=(0., 0.),
+                          long_asc_nodes_range=(0., 0.),
+                          coa_phase_range=(0., 0.),
+                          inclination_range=(0., 0.),
+                          distance_range=(1.e6, 1.e6),
+                          polarization_range=(0., 0.),
+                          latitude_range=(0., 0.),
+                          longitude_range=(0., 0.)):
+    """
+    Numpy record array (of dtype SAMPLE_POINT_DTYPE) of N binaries, with
+    component masses drawn uniformly within `mass_range` (or fixed to
+    `fixed_masses`), spins drawn with uniform_spin_vectors, distances
+    uniform in volume, sky positions with uniform_on_S2_window and all
+    other parameters uniform within their ranges. Each point gets a random
+    10 hex digit hash for its simulation_id.
+
+    If `mtotal_range` is given, points whose total mass falls outside it are
+    dropped, so that fewer than N points may be returned.
+    """
+    p = np.recarray(N, dtype=SAMPLE_POINT_DTYPE)
+
+    if fixed_masses:
+        p.mass1, p.mass2 = fixed_masses
+    else:
+        masses = uniform_mass(2 * N, *mass_range).reshape(N, 2)
+        p.mass1 = masses.max(axis=1)
+        p.mass2 = masses.min(axis=1)
+    mtotal = p.mass1 + p.mass2
+    p.eta = p.mass1 * p.mass2 / mtotal**2
+    p.mchirp = mtotal * p.eta**0.6
+
+    p.spin1x, p.spin1y, p.spin1z = uniform_spin_vectors(
+        N, *(tuple(spin_component_range) + tuple(spin_mag_range)))
+    p.spin2x, p.spin2y, p.spin2z = uniform_spin_vectors(
+        N, *(tuple(spin_component_range) + tuple(spin_mag_range)))
+
+    p.alpha = uniform_bound(eccentricity_range[0], eccentricity_range[1], N)
+    p.alpha1 = uniform_bound(mean_per_ano_range[0], mean_per_ano_range[1], N)
+    p.alpha2 = uniform_bound(long_asc_nodes_range[0],
+                             long_asc_nodes_range[1], N)
+    p.coa_phase = uniform_bound(coa_phase_range[0], coa_phase_range[1], N)
+
+    p.inclination = uniform_bound(inclination_range[0],
+                                  inclination_range[1], N)
+    p.distance = uniform_in_volume_distance(N, *distance_range)
+    p.polarization = uniform_bound(polarization_range[0],
+                                   polarization_range[1], N)
+    p.latitude, p.longitude = uniform_on_S2_window(N, latitude_range,
+                                                   longitude_range)
+
+    p.sim_hash = np.random.randint(0, 16**10, N, dtype=np.int64)
+
+    if mtotal_range is None:
+        return p
+    return p[(mtotal >= mtotal_range[0]) & (mtotal <= mtotal_range[1])]
+
+
 ####
 # **`OneDRandom`**:
 # Metaclass holding a dictionary of methods to draw random numbers
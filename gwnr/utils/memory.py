@@ -25,7 +25,7 @@ from __future__ import print_function
 import sys
 from collections import Mapping
 from numbers import Number
-from collections import Set, Mapping, deque
+from collections import Set, Mapping, deque, OrderedDict
 
 ########################################
 # Other FUNCTIONS
@@ -110,3 +110,87 @@ of arbitrary objects, and prints their total size
 
 
 show_memory_increase = ShowMemoryUsage
+
+
+class LRUCache(object):
+    """
+A dictionary-like store with a budget on the total size of the values it
+holds. Once the budget is exceeded, least-recently-used entries are evicted
+first. Keys can be pinned to protect their entries from eviction, e.g. to
+keep the waveforms of the batch currently being processed resident.
+
+Parameters
+----------
+max_bytes: int
+    Budget on the total size of stored values. None or 0 means unlimited.
+sizeof: function
+    Returns the size in bytes of a stored value. Defaults to MemoryUsage.
+    """
+    def __init__(self, max_bytes=None, sizeof=None):
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof if sizeof is not None else MemoryUsage
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._sizes = {}
+        self._pinned = set()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __getitem__(self, key):
+        value = self._data.pop(key)
+        self._data[key] = value
+        return value
+
+    def __setitem__(self, key, value):
+        if key in self._data:
+            self.pop(key)
+        size = self.sizeof(value)
+        self._data[key] = value
+        self._sizes[key] = size
+        self.nbytes += size
+        self._evict()
+
+    def get(self, key, default=None):
+        """Return the value for `key` and mark it most recently used,
+        recording a hit or a miss"""
+        if key in self._data:
+            self.hits += 1
+            return self[key]
+        self.misses += 1
+        return default
+
+    def pop(self, key):
+        self.nbytes -= self._sizes.pop(key)
+        return self._data.pop(key)
+
+    def pin(self, keys):
+        """Protect entries for `keys` from eviction, whether or not they
+        have been stored yet"""
+        self._pinned.update(keys)
+
+    def unpin(self, keys=None):
+        """Make entries for `keys` (default: all) evictable again, and
+        evict as needed to get back within budget"""
+        if keys is None:
+            self._pinned.clear()
+        else:
+            self._pinned.difference_update(keys)
+        self._evict()
+
+    def _evict(self):
+        if not self.max_bytes or self.nbytes <= self.max_bytes:
+            return
+        for key in list(self._data.keys()):
+            if self.nbytes <= self.max_bytes:
+                break
+            if key in self._pinned:
+                continue
+            self.pop(key)
+            self.evictions += 1
@@ -40,6 +40,7 @@ from pycbc.pnutils import *
 from glue.ligolw import ligolw, lsctables
 
 from gwnr.utils import (find_nearest, trim_leading_zeros, trim_trailing_zeros)
+from gwnr.analysis.psd import cached_psd_from_string
 
 
 class ContentHandler(ligolw.LIGOLWContentHandler):
@@ -471,8 +472,8 @@ def align_waveforms_optimally(hplus1,
     elif type(psd) == str:
         htilde = make_frequency_series(h_plus1)
         psd_name = psd
-        psd = from_string(psd_name, len(htilde), htilde.delta_f,
-                          low_frequency_cutoff)
+        psd = cached_psd_from_string(psd_name, len(htilde),
+                                     htilde.delta_f, low_frequency_cutoff)
     ##
     # 5) Calculate Overlap (maximized) before alignment
     m = match(h_plus1,
@@ -553,13 +554,13 @@ def align_waveforms_optimally(hplus1,
         if len(h_plus1) > len(hp2):
             hp2.append_zeros(len(h_plus1) - len(hp2))
             htilde = make_frequency_series(h_plus1)
-            psd = from_string(psd_name, len(htilde), htilde.delta_f,
-                              low_frequency_cutoff)
+            psd = cached_psd_from_string(psd_name, len(htilde),
+                                         htilde.delta_f, low_frequency_cutoff)
         elif len(h_plus1) < len(hp2):
             h_plus1.append_zeros(len(hp2) - len(h_plus1))
             htilde = make_frequency_series(h_plus1)
-            psd = from_string(psd_name, len(htilde), htilde.delta_f,
-                              low_frequency_cutoff)
+            psd = cached_psd_from_string(psd_name, len(htilde),
+                                         htilde.delta_f, low_frequency_cutoff)
         #
         # 5) Compute UNMAXIMIZED overlap.
         olap = overlap_cplx(h_plus1,
@@ -794,8 +795,8 @@ def align_waveforms_suboptimally(hplus1,
         raise IOError("Need compatible psd [or name] as input!")
     elif type(psd) == str:
         psd_name = psd
-        psd = from_string(psd_name, len(htilde), htilde.delta_f,
-                          low_frequency_cutoff)
+        psd = cached_psd_from_string(psd_name, len(htilde),
+                                     htilde.delta_f, low_frequency_cutoff)
     #
     # Determine the phase and time shifts for optimal match
     snr, corr, snr_norm = matched_filter_core(
@@ -859,8 +860,8 @@ def align_waveforms_suboptimally(hplus1,
 
     if verbose:
         htilde = make_frequency_series(h_plus1)
-        psd = from_string(psd_name, len(htilde), htilde.delta_f,
-                          low_frequency_cutoff)
+        psd = cached_psd_from_string(psd_name, len(htilde),
+                                     htilde.delta_f, low_frequency_cutoff)
         print(("Overlap AFTER ALIGNMENT:",
                overlap_cplx(h_plus1,
                             hp2,
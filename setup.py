@@ -142,6 +142,7 @@ if __name__ == "__main__":
             'bin/gwnr_create_public_events_bilby_workflow', 'bin/gwnr_banksim',
             'bin/gwnr_faithsim', 'bin/gwnr_force_success_from_condor_sub',
             'bin/gwnr_sample_parameter_space',
+            'bin/gwnr_place_bank_stochastic',
             'bin/gwnr_enigma_plan_calib_grid_and_make_dag',
             'bin/gwnr_enigma_sample_calib_parameters',
             'bin/utils/toggle_lsctable_type', 'bin/utils/ConvertHTMLToIpynb',